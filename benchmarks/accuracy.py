@@ -0,0 +1,130 @@
+"""
+Pixel budget accuracy check.
+
+Generates every installed backend's palette for each image twice, once
+sampled down to the pixel budget and once at full resolution, and
+reports the mean CIE76 delta E between matching colors. Fails when a
+backend's mean goes over the limit, so the budget can be lowered for
+speed without quietly changing palettes.
+
+    python3 benchmarks/accuracy.py [--budget 250000] [--max-delta-e 10]
+                                   [--corpus DIR] [--backend NAME ...]
+
+Uses the synthetic corpus from backends.py plus any wallpapers in DIR.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from benchmarks import backends as bench  # noqa: E402
+from pywal import backends, util  # noqa: E402
+
+
+def run(backend, img):
+    """Generate a palette from scratch, printing it and the time taken."""
+    from pywal import colors
+
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        scheme = colors.get(img, backend=backend, cache_dir=cache_dir)
+
+    palette = [scheme["colors"]["color%s" % i] for i in range(16)]
+    print(json.dumps([palette, time.perf_counter() - start]))
+
+
+def palette(backend, img, budget):
+    """Run one backend on one image with a pixel budget, 0 for none."""
+    env = {**os.environ, "PYWAL_PIXEL_BUDGET": str(budget), "PYWAL_SEED": "0"}
+    env.pop("PYWAL_SOCKET", None)
+
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run", backend, img],
+        capture_output=True,
+        check=False,
+        env=env,
+        text=True,
+    ).stdout
+
+    return json.loads(out.splitlines()[-1]) if out.strip() else (None, None)
+
+
+def delta_e(palette1, palette2):
+    """Mean CIE76 delta E from each color to the closest in the other.
+
+    Matching colors rather than slots keeps a small shift in the sort
+    order, which moves every later slot, from counting as a change.
+    """
+    lab1 = util.rgb_array_to_lab(util.hex_to_rgb_array(palette1))
+    lab2 = util.rgb_array_to_lab(util.hex_to_rgb_array(palette2))
+    dist = (((lab1[:, None] - lab2[None]) ** 2).sum(axis=-1)) ** 0.5
+
+    return float((dist.min(axis=0).mean() + dist.min(axis=1).mean()) / 2)
+
+
+def check(names, images, budget, max_delta_e):
+    """Compare every backend at the budget against full resolution."""
+    failed = []
+
+    for name in names:
+        if not backends.available(name):
+            print("%-16s skipped, missing %s" % (name, backends.missing(name)))
+            continue
+
+        deltas = []
+
+        for img in images:
+            sampled, sampled_time = palette(name, img, budget)
+            full, full_time = palette(name, img, 0)
+
+            if sampled is None or full is None:
+                print("%-16s %-20s failed" % (name, os.path.basename(img)))
+                continue
+
+            deltas.append(delta_e(sampled, full))
+            print(
+                "%-16s %-20s dE %6.2f  %7.3fs (full %7.3fs)"
+                % (name, os.path.basename(img), deltas[-1], sampled_time, full_time)
+            )
+
+        if deltas and sum(deltas) / len(deltas) > max_delta_e:
+            failed.append(name)
+
+        if deltas:
+            print("%-16s mean dE %.2f" % (name, sum(deltas) / len(deltas)))
+
+    return failed
+
+
+def main():
+    """Parse arguments and check every backend."""
+    arg = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    arg.add_argument("--budget", type=int, default=250000)
+    arg.add_argument("--max-delta-e", type=float, default=10.0)
+    arg.add_argument("--corpus", help="directory of real wallpapers to add")
+    arg.add_argument("--backend", action="append", help="backend to check")
+    args = arg.parse_args()
+
+    if args.run:
+        run(*args.run)
+        return
+
+    images = bench.corpus(extra=args.corpus)
+    names = args.backend or list(backends.BACKENDS)
+    failed = check(names, images, args.budget, args.max_delta_e)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Backend benchmark.
+
+Generates a deterministic synthetic corpus (plus any real wallpapers you
+point it at) and runs every installed backend's get on each image, cold
+in a fresh interpreter and then warm in the same one. Wall time, CPU
+time, the number of subprocesses spawned and how many of them decoded
+the source image are reported as JSON and can be compared against a
+stored baseline. Peak RSS only goes down once per process, so it is
+reported for the cold phase alone.
+
+    python3 benchmarks/backends.py [--corpus DIR] [--backend NAME ...]
+                                   [--output FILE] [--baseline FILE]
+                                   [--tolerance 0.25]
+
+Needs NumPy and Pillow to generate the synthetic images.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pywal import backends  # noqa: E402 pylint: disable=wrong-import-position
+
+IMAGE_DIR = os.path.join(tempfile.gettempdir(), "pywal-bench")
+
+# name: (width, height, kind, format)
+SYNTHETIC = {
+    "gradient_1080p": (1920, 1080, "gradient", "PNG"),
+    "flat_1080p": (1920, 1080, "flat", "PNG"),
+    "noise_1080p": (1920, 1080, "noise", "PNG"),
+    "photo_1080p": (1920, 1080, "photo", "JPEG"),
+    "photo_4k": (3840, 2160, "photo", "JPEG"),
+    "photo_8k": (7680, 4320, "photo", "JPEG"),
+}
+
+
+def synthesize(width, height, kind, seed=0):
+    """Render a deterministic synthetic wallpaper as an RGB array."""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+
+    if kind == "gradient":
+        x = np.linspace(0, 255, width)[None, :]
+        y = np.linspace(0, 255, height)[:, None]
+        rgb = np.stack(np.broadcast_arrays(x, y, (x + y) / 2), axis=-1)
+
+    elif kind == "flat":
+        # A handful of solid bands, the worst case for retry loops.
+        bands = rng.integers(0, 256, (6, 3))
+        rgb = bands[np.arange(height) * len(bands) // height][:, None, :]
+        rgb = np.broadcast_to(rgb, (height, width, 3))
+
+    elif kind == "noise":
+        rgb = rng.integers(0, 256, (height, width, 3))
+
+    else:
+        # Smooth low frequency structure with fine grain on top, added
+        # in strips to keep 8K images from needing gigabytes.
+        coarse = rng.integers(0, 256, (9, 16, 3), dtype=np.uint8)
+        coarse = Image.fromarray(coarse).resize((width, height), Image.BICUBIC)
+        rgb = np.array(coarse)
+
+        for row in range(0, height, 256):
+            strip = rgb[row : row + 256]
+            grain = rng.integers(-12, 13, strip.shape, dtype=np.int16)
+            strip[:] = np.clip(strip + grain, 0, 255)
+
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def corpus(image_dir=IMAGE_DIR, extra=None):
+    """Write the synthetic corpus once and list every image to run."""
+    from PIL import Image
+
+    os.makedirs(image_dir, exist_ok=True)
+    images = []
+
+    for seed, (name, (width, height, kind, fmt)) in enumerate(SYNTHETIC.items()):
+        path = os.path.join(image_dir, "%s.%s" % (name, fmt.lower()))
+
+        if not os.path.isfile(path):
+            rgb = synthesize(width, height, kind, seed)
+            Image.fromarray(rgb).save(path, fmt, quality=90)
+
+        images.append(path)
+
+    if extra:
+        images += sorted(
+            os.path.join(extra, f)
+            for f in os.listdir(extra)
+            if f.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".webp"))
+        )
+
+    return images
+
+
+def peak_rss():
+    """Peak RSS of this process in KiB."""
+    # Linux carries ru_maxrss over exec, so the parent's peak would leak
+    # into ours. VmHWM starts over with the new address space.
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+
+    except OSError:
+        pass
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def usage():
+    """Wall, CPU, peak RSS (KiB) of this process and its children so far."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    scale = 1024 if sys.platform == "darwin" else 1
+
+    return {
+        "wall": time.perf_counter(),
+        "cpu": own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime,
+        "rss": max(peak_rss(), kids.ru_maxrss // scale),
+    }
+
+
+def run(backend, img):
+    """Time a cold and a warm get in this process, printing JSON."""
+    spawned = [0, 0]
+    execute_child = subprocess.Popen._execute_child
+
+    # Count every fork/exec the backend does through subprocess, and the
+    # ones handed the source image to decode.
+    def counting(self, cmd, *args, **kwargs):
+        spawned[0] += 1
+        spawned[1] += any(str(arg).startswith(img) for arg in cmd)
+        return execute_child(self, cmd, *args, **kwargs)
+
+    subprocess.Popen._execute_child = counting
+    results = []
+
+    for phase in ("cold", "warm"):
+        before, spawned[:] = usage(), [0, 0]
+
+        try:
+            backends.load(backend).get(img, False)
+            error = None
+        except (Exception, SystemExit) as err:  # pylint: disable=broad-except
+            error = "%s: %s" % (type(err).__name__, err)
+
+        after = usage()
+        results.append(
+            {
+                "backend": backend,
+                "image": os.path.basename(img),
+                "phase": phase,
+                "wall": round(after["wall"] - before["wall"], 4),
+                "cpu": round(after["cpu"] - before["cpu"], 4),
+                # The warm phase's peak would still be the cold one.
+                "rss": after["rss"] if phase == "cold" else None,
+                "subprocesses": spawned[0],
+                "decodes": spawned[1],
+                "error": error,
+            }
+        )
+
+    print(json.dumps(results))
+
+
+def failed(backend, img, phase, error):
+    """A result for a phase that never got to run."""
+    return {
+        "backend": backend,
+        "image": os.path.basename(img),
+        "phase": phase,
+        "wall": 0.0,
+        "cpu": 0.0,
+        "rss": None,
+        "subprocesses": 0,
+        "decodes": 0,
+        "error": error,
+    }
+
+
+def bench(names, images):
+    """Run every backend on every image, each pair in a fresh interpreter."""
+    results = []
+
+    for name in names:
+        if not backends.available(name):
+            print("%-16s skipped, missing %s" % (name, backends.missing(name)))
+            continue
+
+        for img in images:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", name, img],
+                capture_output=True,
+                check=False,
+                text=True,
+            )
+
+            try:
+                pair = json.loads(child.stdout.splitlines()[-1])
+
+            # A crashed child fails this pair only, the rest still run.
+            except (IndexError, ValueError):
+                stderr = child.stderr.strip().splitlines() or ["no output"]
+                error = "exit status %s: %s" % (child.returncode, stderr[-1])
+                pair = [failed(name, img, phase, error) for phase in ("cold", "warm")]
+
+            for result in pair:
+                results.append(result)
+                rss = "-" if result["rss"] is None else result["rss"]
+                print(
+                    "%(backend)-16s %(image)-20s %(phase)-5s %(wall)8.3fs "
+                    "cpu %(cpu)8.3fs" % result,
+                    "rss %8s KiB" % rss,
+                    "procs %(subprocesses)3d decodes %(decodes)3d" % result,
+                    "" if result["error"] is None else result["error"],
+                )
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """List results slower than the baseline by more than the tolerance."""
+    old = {(r["backend"], r["image"], r["phase"]): r for r in baseline}
+    regressions = []
+
+    for result in results:
+        key = (result["backend"], result["image"], result["phase"])
+
+        if key in old and result["wall"] > old[key]["wall"] * (1 + tolerance):
+            regressions.append((result, old[key]))
+
+    return regressions
+
+
+def main():
+    """Parse arguments, run the benchmark and check for regressions."""
+    arg = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    arg.add_argument("--corpus", help="directory of real wallpapers to add")
+    arg.add_argument("--images", default=IMAGE_DIR, help="synthetic image dir")
+    arg.add_argument("--backend", action="append", help="backend to run")
+    arg.add_argument("--output", help="write JSON results to this file")
+    arg.add_argument("--baseline", help="JSON results to compare against")
+    arg.add_argument("--tolerance", type=float, default=0.25)
+    args = arg.parse_args()
+
+    if args.run:
+        run(*args.run)
+        return
+
+    images = corpus(args.images, args.corpus)
+    results = bench(args.backend or list(backends.BACKENDS), images)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+
+        for new, old in regressions:
+            print(
+                "REGRESSION %s %s %s: %.3fs -> %.3fs"
+                % (new["backend"], new["image"], new["phase"], old["wall"], new["wall"])
+            )
+
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
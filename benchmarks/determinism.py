@@ -0,0 +1,104 @@
+"""
+Determinism check for PYWAL_SEED.
+
+Generates a scheme with every installed backend (and "random") in
+several fresh interpreters, each with its own empty cache directory and
+hash seed, and fails unless every run renders byte-identical exports.
+Identical output is what lets a shared build cache reuse schemes.
+
+    python3 benchmarks/determinism.py [--runs 3] [--seed 0]
+                                      [--backend NAME ...] [IMAGE]
+
+Without an image it uses the synthetic 1080p photo from backends.py.
+"""
+
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pywal import backends  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def run(backend, img):
+    """Generate and render one scheme from scratch, printing its hash."""
+    from pywal import colors, export
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        scheme = colors.get(img, backend=backend, cache_dir=cache_dir)
+
+    # The wallpaper path is an input, not something we generated.
+    scheme["wallpaper"] = os.path.basename(img)
+    digest = hashlib.blake2b(digest_size=16)
+
+    for target, text in sorted(export.render(scheme).items()):
+        digest.update(target.encode() + b"\0" + text.encode())
+
+    print(digest.hexdigest())
+
+
+def check(names, img, runs, seed):
+    """Run each backend several times, returning the ones that differ."""
+    failed = []
+
+    for name in names:
+        if name != "random" and not backends.available(name):
+            print("%-16s skipped, missing %s" % (name, backends.missing(name)))
+            continue
+
+        digests = set()
+
+        for i in range(runs):
+            env = {**os.environ, "PYWAL_SEED": seed, "PYTHONHASHSEED": str(i)}
+            env.pop("PYWAL_SOCKET", None)
+
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", name, img],
+                capture_output=True,
+                check=True,
+                env=env,
+                text=True,
+            ).stdout
+            digests.add(out.splitlines()[-1])
+
+        print("%-16s %s" % (name, "ok" if len(digests) == 1 else "DIFFERS"))
+
+        if len(digests) != 1:
+            failed.append(name)
+
+    return failed
+
+
+def main():
+    """Parse arguments and check every backend."""
+    arg = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    arg.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    arg.add_argument("--runs", type=int, default=3)
+    arg.add_argument("--seed", default="0")
+    arg.add_argument("--backend", action="append", help="backend to check")
+    arg.add_argument("image", nargs="?")
+    args = arg.parse_args()
+
+    if args.run:
+        run(*args.run)
+        return
+
+    img = args.image
+
+    if img is None:
+        # pylint: disable=import-outside-toplevel
+        from benchmarks import backends as bench
+
+        img = [i for i in bench.corpus() if "photo_1080p" in i][0]
+
+    names = args.backend or [*backends.BACKENDS, "random"]
+    sys.exit(1 if check(names, img, args.runs, args.seed) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Import-time budget for pywal.colors and wrap.py.
+
+Runs fresh interpreters under -X importtime, parses the report and fails
+when an import goes over budget or pulls in a backend's dependencies,
+which a cache hit must never pay for.
+
+    python3 benchmarks/imports.py [budget_ms]
+"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+
+TARGETS = {
+    "pywal.colors": ["-c", "import pywal.colors"],
+    "wrap.py": [os.path.join(ROOT, "wrap.py")],
+}
+
+# Modules that only a backend doing real work may import.
+FORBIDDEN = [
+    "PIL",
+    "colorthief",
+    "colorz",
+    "fast_colorthief",
+    "haishoku",
+    "numpy",
+    "scipy",
+]
+
+
+def importtime(args):
+    """Parse -X importtime output into top-level and all module timings."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        text=True,
+    ).stderr
+
+    top, modules = {}, {}
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line.split("|")
+        modules[name.strip()] = int(cumulative)
+
+        # Nested imports are indented beneath their importer.
+        if not name[1:].startswith(" "):
+            top[name.strip()] = int(cumulative)
+
+    return top, modules
+
+
+def measure(args):
+    """Best total import time in ms over a few runs, and the modules seen."""
+    best, modules = None, {}
+
+    for _ in range(RUNS):
+        top, modules = importtime(args)
+        total = sum(top.values()) / 1000
+
+        if best is None or total < best:
+            best = total
+
+    return best, modules
+
+
+def main():
+    """Check every target against the budget."""
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 75.0
+    failed = False
+
+    for target, args in TARGETS.items():
+        total, modules = measure(args)
+        heavy = [m for m in FORBIDDEN if m in modules]
+        over = total > budget
+
+        print("%-14s %7.1f ms (budget %.1f ms)" % (target, total, budget))
+
+        if heavy:
+            print("  imports %s" % ", ".join(heavy))
+
+        failed |= over or bool(heavy)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
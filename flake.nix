@@ -31,103 +31,101 @@
 
           pkgs = import nixpkgs { inherit system; };
 
-          colourScheme = builtins.fromJSON (
-            builtins.readFile "${
-              pkgs.runCommand "colour-scheme"
-                {
-                  buildInputs = with pkgs; [
-                    imagemagick
-                    jq
-                    (pkgs.python3.withPackages (ps: [
-                      ps.colorthief
-                      ps.numpy
-                      ps.pillow
-                      (ps.buildPythonPackage rec {
-                        pname = "haishoku";
-                        version = "1.1.8";
-                        format = "setuptools";
-                        doCheck = false;
-
-                        src = ps.fetchPypi {
-                          inherit pname version;
-                          hash = "sha256-5LmhTANYYIGxirzwS0MgFo/qk/9hHoGyvM1dUmn/y9Q=";
-                        };
-                      })
-                      (ps.buildPythonPackage {
-                        pname = "fast_colorthief";
-                        version = "0.0.5";
-                        format = "setuptools";
-                        doCheck = false;
-                        dontUseCmakeConfigure = true;
-
-                        # The vendored CMakeLists.txt requests a pre-3.5 policy
-                        # version, which modern CMake refuses outright.
-                        env.CMAKE_POLICY_VERSION_MINIMUM = "3.5";
-
-                        nativeBuildInputs = [
-                          pkgs.cmake
-                          ps.setuptools
-                          ps.setuptools-scm
-                          ps.scikit-build
-                        ];
-
-                        src = pkgs.fetchgit {
-                          url = "https://github.com/bedapisl/fast-colorthief";
-                          rev = "92eda78157bed309ef9c12e85708ae21241e11d0";
-                          hash = "sha256-0S8YI2DlEMx75vuAxcWzTBCcerLvULdh4nY2k3zdsqg=";
-                          fetchSubmodules = true;
-                        };
-                      })
-                      (ps.buildPythonPackage rec {
-                        pname = "colorz";
-                        version = "1.0.3";
-                        format = "setuptools";
-                        doCheck = false;
-
-                        propagatedBuildInputs = [
-                          ps.pillow
-                          ps.scipy
-                        ];
-
-                        src = ps.fetchPypi {
-                          inherit pname version;
-
-                          hash = "sha256-wE/2OJYoHy7hMnvN/y52ozn3BVmr2KJdKMDR+yhIDT4=";
-                        };
-                      })
-                    ]))
-                    (pkgs.buildGoModule {
-                      pname = "schemer2";
-                      version = "89a66cbf40440e82921719c6919f11bb563d7cfa";
-                      vendorHash = null;
-
-                      src = pkgs.fetchFromGitHub {
-                        owner = "thefryscorer";
-                        repo = "schemer2";
-                        rev = "89a66cbf40440e82921719c6919f11bb563d7cfa";
-                        hash = "sha256-EKjVz4NkxtxqGissFwlzUahFut9UAxS8icxx3V7aNnw=";
+          colourSchemeFiles =
+            pkgs.runCommand "colour-scheme"
+              {
+                # Same wallpaper and options, same scheme, on any machine.
+                PYWAL_SEED = "pywal-nix";
+
+                buildInputs = with pkgs; [
+                  imagemagick
+                  (pkgs.python3.withPackages (ps: [
+                    ps.numpy
+                    ps.pillow
+                    (ps.buildPythonPackage rec {
+                      pname = "haishoku";
+                      version = "1.1.8";
+                      format = "setuptools";
+                      doCheck = false;
+
+                      src = ps.fetchPypi {
+                        inherit pname version;
+                        hash = "sha256-5LmhTANYYIGxirzwS0MgFo/qk/9hHoGyvM1dUmn/y9Q=";
                       };
+                    })
+                    (ps.buildPythonPackage {
+                      pname = "fast_colorthief";
+                      version = "0.0.5";
+                      format = "setuptools";
+                      doCheck = false;
+                      dontUseCmakeConfigure = true;
+
+                      # The vendored CMakeLists.txt requests a pre-3.5 policy
+                      # version, which modern CMake refuses outright.
+                      env.CMAKE_POLICY_VERSION_MINIMUM = "3.5";
+
+                      nativeBuildInputs = [
+                        pkgs.cmake
+                        ps.setuptools
+                        ps.setuptools-scm
+                        ps.scikit-build
+                      ];
+
+                      src = pkgs.fetchgit {
+                        url = "https://github.com/bedapisl/fast-colorthief";
+                        rev = "92eda78157bed309ef9c12e85708ae21241e11d0";
+                        hash = "sha256-0S8YI2DlEMx75vuAxcWzTBCcerLvULdh4nY2k3zdsqg=";
+                        fetchSubmodules = true;
+                      };
+                    })
+                    (ps.buildPythonPackage rec {
+                      pname = "colorz";
+                      version = "1.0.3";
+                      format = "setuptools";
+                      doCheck = false;
+
+                      propagatedBuildInputs = [
+                        ps.pillow
+                        ps.scipy
+                      ];
 
-                      postPatch = ''
-                        printf 'module github.com/Fuwn/schemer2\n\ngo 1.22.5\n' > go.mod
-                      '';
+                      src = ps.fetchPypi {
+                        inherit pname version;
+
+                        hash = "sha256-wE/2OJYoHy7hMnvN/y52ozn3BVmr2KJdKMDR+yhIDT4=";
+                      };
                     })
-                  ];
-                }
-                ''
-                  mkdir -p $out/wrapper
-
-                  cp ${./wrap.py} $out/wrapper/wrap.py
-                  cp -r ${./pywal} $out/wrapper/pywal
-
-                  python3 $out/wrapper/wrap.py ${config.pywal-nix.backend} ${config.pywal-nix.wallpaper} ${
-                    if config.pywal-nix.light then "1" else "0"
-                  } | \
-                    sed "s/'/\"/g" | \
-                    jq 'to_entries | map({"colour\(.key)": .value, "color\(.key)": .value}) | add' > $out/colour-scheme
-                ''
-            }/colour-scheme"
-          );
+                  ]))
+                  (pkgs.buildGoModule {
+                    pname = "schemer2";
+                    version = "89a66cbf40440e82921719c6919f11bb563d7cfa";
+                    vendorHash = null;
+
+                    src = pkgs.fetchFromGitHub {
+                      owner = "thefryscorer";
+                      repo = "schemer2";
+                      rev = "89a66cbf40440e82921719c6919f11bb563d7cfa";
+                      hash = "sha256-EKjVz4NkxtxqGissFwlzUahFut9UAxS8icxx3V7aNnw=";
+                    };
+
+                    postPatch = ''
+                      printf 'module github.com/Fuwn/schemer2\n\ngo 1.22.5\n' > go.mod
+                    '';
+                  })
+                ];
+              }
+              ''
+                mkdir -p $out/wrapper
+
+                cp ${./wrap.py} $out/wrapper/wrap.py
+                cp -r ${./pywal} $out/wrapper/pywal
+
+                python3 $out/wrapper/wrap.py ${config.pywal-nix.backend} ${config.pywal-nix.wallpaper} ${
+                  if config.pywal-nix.light then "1" else "0"
+                } $out
+              '';
+
+          colourScheme = builtins.fromJSON (builtins.readFile "${colourSchemeFiles}/colours.json");
         in
         {
           options.pywal-nix = {
@@ -142,7 +140,9 @@
                 "colorz"
                 "fast_colorthief"
                 "haishoku"
+                "mediancut"
                 "schemer2"
+                "stream"
                 "wal"
               ];
 
@@ -185,27 +185,9 @@
             pywal-nix.colorScheme = config.pywal-nix.colourScheme;
           };
 
-          config.programs.kitty.extraConfig = lib.mkIf config.pywal-nix.enableKittyIntegration ''
-            foreground ${config.pywal-nix.colourScheme.special.foreground}
-            background ${config.pywal-nix.colourScheme.special.background}
-            cursor ${config.pywal-nix.colourScheme.special.cursor}
-            color0 ${config.pywal-nix.colourScheme.colours.colour0}
-            color1 ${config.pywal-nix.colourScheme.colours.colour1}
-            color2 ${config.pywal-nix.colourScheme.colours.colour2}
-            color3 ${config.pywal-nix.colourScheme.colours.colour3}
-            color4 ${config.pywal-nix.colourScheme.colours.colour4}
-            color5 ${config.pywal-nix.colourScheme.colours.colour5}
-            color6 ${config.pywal-nix.colourScheme.colours.colour6}
-            color7 ${config.pywal-nix.colourScheme.colours.colour7}
-            color8 ${config.pywal-nix.colourScheme.colours.colour8}
-            color9 ${config.pywal-nix.colourScheme.colours.colour9}
-            color10 ${config.pywal-nix.colourScheme.colours.colour10}
-            color11 ${config.pywal-nix.colourScheme.colours.colour11}
-            color12 ${config.pywal-nix.colourScheme.colours.colour12}
-            color13 ${config.pywal-nix.colourScheme.colours.colour13}
-            color14 ${config.pywal-nix.colourScheme.colours.colour14}
-            color15 ${config.pywal-nix.colourScheme.colours.colour15}
-          '';
+          config.programs.kitty.extraConfig = lib.mkIf config.pywal-nix.enableKittyIntegration (
+            builtins.readFile "${colourSchemeFiles}/kitty.conf"
+          );
         };
 
       formatter = nixpkgs.legacyPackages."${system}".nixfmt-rfc-style;
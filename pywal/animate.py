@@ -0,0 +1,188 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Generate a timeline of colorschemes for animated wallpapers.
+"""
+
+import logging
+import os
+import sys
+
+from . import cache
+from . import colors
+from . import trace
+from . import util
+from .settings import CACHE_DIR
+
+
+def frames(img, size=256):
+    """Decode every frame of an animation, scaled down to fit size."""
+    from PIL import Image, ImageSequence
+
+    with Image.open(img) as image:
+        for frame in ImageSequence.Iterator(image):
+            duration = frame.info.get("duration", 0) or 100
+
+            # GIF frames are palette images with a full frame behind them.
+            frame = frame.convert("RGB")
+            frame.thumbnail((size, size), Image.Resampling.BOX)
+
+            yield duration, frame
+
+
+def kmeans(bins, counts, centroids, iterations=4, priority=None):
+    """Refine centroids over histogram bins with weighted Lloyd steps.
+
+    Centroids left without pixels are re-seeded in priority order, by
+    default from the last one back.
+    """
+    import numpy as np
+
+    centroids = np.array(centroids, dtype=float)
+
+    if priority is None:
+        priority = range(len(centroids) - 1, -1, -1)
+
+    priority = np.asarray(priority)
+
+    for _ in range(iterations):
+        dist = ((bins[:, None] - centroids[None]) ** 2).sum(axis=-1)
+        nearest = dist.argmin(axis=1)
+
+        weight = np.bincount(nearest, counts, len(centroids))
+        moved = np.stack(
+            [np.bincount(nearest, counts * bins[:, i], len(weight)) for i in range(3)],
+            axis=-1,
+        )
+
+        used = weight > 0
+        moved[used] /= weight[used, None]
+
+        # Centroids without pixels, padding and duplicates among them,
+        # move to the bins the others serve worst, heaviest error first.
+        empty = priority[~used[priority]]
+        error = counts * dist[np.arange(len(bins)), nearest]
+        worst = np.argsort(error)[::-1][: len(empty)]
+        worst = worst[error[worst] > 0]
+        moved[empty[: len(worst)]] = bins[worst]
+
+        # With no bins left to take, they follow the nearest used centroid
+        # rather than hold on to a color the frame doesn't have.
+        rest = empty[len(worst) :]
+        near = ((centroids[rest, None] - moved[None, used]) ** 2).sum(axis=-1)
+        moved[rest] = moved[used][near.argmin(axis=1)]
+
+        if np.abs(moved - centroids).max() < 0.5:
+            return moved
+
+        centroids = moved
+
+    return centroids
+
+
+def timeline(img, light=False, threshold=0.05, size=256):
+    """Extract a palette per frame, reusing the last for unchanged frames.
+
+    Each frame is binned into the mediancut histogram. Frames whose
+    histogram moved less than threshold (the fraction of pixels that
+    changed bins) extend the previous entry. The others warm-start
+    k-means from the previous frame's centroids, so slots stay stable.
+    """
+    import numpy as np
+
+    from .backends import mediancut, wal
+
+    entries = []
+    last_counts = centroids = order = priority = None
+    start = 0
+
+    for index, (duration, frame) in enumerate(frames(img, size)):
+        with trace.span("frame", index=index):
+            hist = mediancut.Histogram()
+            hist.add(np.asarray(frame, dtype=np.uint8).reshape(-1, 3))
+            counts = hist.counts / hist.counts.sum()
+
+            if last_counts is not None:
+                changed = np.abs(counts - last_counts).sum() / 2
+
+                if changed < threshold:
+                    entries[-1]["duration"] += duration
+                    start += duration
+                    continue
+
+            bins, weights = hist.colors()
+
+            if centroids is None:
+                centroids = mediancut.median_cut(bins, weights, 16)
+
+                # Flat frames can't be cut into 16 boxes, repeat the last.
+                centroids += centroids[-1:] * (16 - len(centroids))
+
+            centroids = kmeans(bins, weights, centroids, priority=priority)
+            raw_colors = [util.rgb_to_hex(c) for c in centroids.round().astype(int)]
+
+            # Sort once, then keep each centroid in its slot.
+            if order is None:
+                order = sorted(range(16), key=lambda i: util.rgb_to_yiq(raw_colors[i]))
+
+                # New colors go to the slots wal.adjust keeps, 8-14, first.
+                slots = [*range(8, 15), *range(1, 8), 15, 0]
+                priority = [order[i] for i in slots]
+
+            entries.append(
+                {
+                    "frame": index,
+                    "start": start,
+                    "duration": duration,
+                    "colors": wal.adjust([raw_colors[i] for i in order], light),
+                }
+            )
+
+            last_counts = counts
+            start += duration
+
+    if not entries:
+        logging.error("No frames could be read from %s.", img)
+        sys.exit(1)
+
+    return entries
+
+
+def get(img, light=False, cache_dir=CACHE_DIR, sat="", threshold=0.05, size=256):
+    """Generate, or read from the cache, a timeline of schemes."""
+    backend = "timeline-%s-%s" % (threshold, size)
+    cache_file = os.path.join(*colors.cache_fname(img, backend, light, cache_dir, sat))
+
+    if os.path.isfile(cache_file):
+        entries = util.read_file_json(cache_file)
+        cache.touch(cache_file)
+        logging.info("Found cached timeline.")
+        return entries
+
+    logging.info("Generating a timeline.")
+    entries = timeline(img, light, threshold, size)
+
+    for entry in entries:
+        palette = colors.saturate_colors(util.Palette.from_hex(entry["colors"]), sat)
+        entry["colors"] = colors.colors_to_dict(palette, img)
+
+    util.save_file_json(entries, cache_file)
+    cache.prune(os.path.dirname(cache_file))
+
+    return entries
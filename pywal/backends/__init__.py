@@ -0,0 +1,113 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Backend registry.
+
+Describes every backend without importing it, so listing backends and
+checking their dependencies never pays for NumPy, SciPy or Pillow.
+
+Every backend module has gen_colors(img), the expensive extraction of
+raw colors, and adjust(colors, light), which turns those into the final
+16 colors. get(img, light) is the two together, and get_async(img,
+light) is get without blocking an event loop.
+"""
+
+import importlib
+import importlib.util
+import shutil
+
+
+# modules:    Python modules the backend imports, all required.
+# commands:   Executables the backend runs, any one of them will do.
+# subprocess: The heavy lifting happens in an external process.
+# thumbnail:  The backend can read the shared PPM thumbnails.
+BACKENDS = {
+    "colorthief": {
+        "modules": ["PIL"],
+        "commands": [],
+        "subprocess": False,
+        "thumbnail": True,
+    },
+    "colorz": {
+        "modules": ["colorz"],
+        "commands": [],
+        "subprocess": False,
+        "thumbnail": True,
+    },
+    "fast_colorthief": {
+        "modules": ["fast_colorthief"],
+        "commands": [],
+        "subprocess": False,
+        "thumbnail": True,
+    },
+    "haishoku": {
+        "modules": ["haishoku"],
+        "commands": [],
+        "subprocess": False,
+        "thumbnail": True,
+    },
+    "mediancut": {
+        "modules": ["numpy", "PIL"],
+        "commands": [],
+        "subprocess": False,
+        "thumbnail": True,
+    },
+    "schemer2": {
+        "modules": [],
+        "commands": ["schemer2"],
+        "subprocess": True,
+        "thumbnail": False,
+    },
+    "stream": {
+        "modules": ["numpy", "PIL"],
+        "commands": [],
+        "subprocess": False,
+        "thumbnail": False,
+    },
+    "wal": {
+        "modules": [],
+        "commands": ["magick", "convert"],
+        "subprocess": True,
+        "thumbnail": True,
+    },
+}
+
+
+def missing(backend):
+    """List what a backend is missing, without importing anything."""
+    if backend not in BACKENDS:
+        return [backend]
+
+    info = BACKENDS[backend]
+    deps = [m for m in info["modules"] if not importlib.util.find_spec(m)]
+
+    if info["commands"] and not any(map(shutil.which, info["commands"])):
+        deps.append(" or ".join(info["commands"]))
+
+    return deps
+
+
+def available(backend):
+    """Check whether a backend's dependencies are installed."""
+    return not missing(backend)
+
+
+def load(backend):
+    """Import a backend module on first use."""
+    return importlib.import_module("%s.%s" % (__name__, backend))
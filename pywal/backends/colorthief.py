@@ -15,38 +15,261 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 # FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
+#
+# Box, split, histogram and quantize are ported from color-thief-py's
+# MMCQ, which carries the following notice.
+#
+# Copyright (c) 2015 by Shipeng Feng.
+#
+# Some rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#
+#     * Redistributions in binary form must reproduce the above
+#       copyright notice, this list of conditions and the following
+#       disclaimer in the documentation and/or other materials provided
+#       with the distribution.
+#
+#     * The names of the contributors may not be used to endorse or
+#       promote products derived from this software without specific
+#       prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 """
-Generate a colorscheme using ColorThief.
+Generate a colorscheme using ColorThief's modified median cut (MMCQ).
 """
 
 import logging
 import sys
 
 try:
-    from colorthief import ColorThief
+    from PIL import Image
 
 except ImportError:
-    logging.error("ColorThief wasn't found on your system.")
+    logging.error("Pillow wasn't found on your system.")
     logging.error("Try another backend. (wal --backend)")
     sys.exit(1)
 
+from .. import colors
+from .. import trace
 from .. import util
 
+SIGBITS = 5
+RSHIFT = 8 - SIGBITS
+QUALITY = 10
+MAX_ITERATION = 1000
+FRACT_BY_POPULATIONS = 0.75
+
+
+class Box:
+    """A box in the quantized RGB cube and the histogram cells inside it."""
+
+    __slots__ = ("lo", "hi", "cells", "count", "volume", "_avg")
+
+    def __init__(self, lo, hi, cells):
+        self.lo = lo
+        self.hi = hi
+        self.cells = cells
+        self.count = sum(count for _, count in cells)
+        self.volume = 1
+        self._avg = None
+
+        for low, high in zip(lo, hi):
+            self.volume *= high - low + 1
+
+    def avg(self):
+        """Population weighted mean color, the center of an empty box."""
+        if self._avg is None:
+            mult = 1 << RSHIFT
+
+            if self.count:
+                sums = [0, 0, 0]
+
+                for rgb, count in self.cells:
+                    for i in range(3):
+                        sums[i] += (rgb[i] + 0.5) * mult * count
+
+                self._avg = tuple(int(total / self.count) for total in sums)
+
+            else:
+                self._avg = tuple(
+                    int(mult * (low + high + 1) / 2)
+                    for low, high in zip(self.lo, self.hi)
+                )
+
+        return self._avg
+
+    def cut(self):
+        """Split at the median of the widest axis, as ColorThief does."""
+        if self.count == 1:
+            return self, None
+
+        axis = max(range(3), key=lambda i: (self.hi[i] - self.lo[i], -i))
+        first, last = self.lo[axis], self.hi[axis]
+
+        sums = [0] * (last - first + 2)
+
+        for rgb, count in self.cells:
+            sums[rgb[axis] - first + 1] += count
+
+        # partial[i] is the population at or below plane first + i - 1.
+        partial = {}
+        total = 0
+
+        for i in range(first, last + 1):
+            total += sums[i - first + 1]
+            partial[i] = total
+
+        for i in range(first, last + 1):
+            if partial[i] > total / 2:
+                left, right = i - first, last - i
+
+                if left <= right:
+                    plane = min(last - 1, int(i + right / 2))
+                else:
+                    plane = max(first, int(i - 1 - left / 2))
+
+                # Avoid empty boxes where the population allows.
+                while not partial.get(plane):
+                    plane += 1
+
+                while partial[plane] == total and partial.get(plane - 1):
+                    plane -= 1
+
+                hi = list(self.hi)
+                lo = list(self.lo)
+                hi[axis] = plane
+                lo[axis] = plane + 1
+
+                below = [cell for cell in self.cells if cell[0][axis] <= plane]
+                above = [cell for cell in self.cells if cell[0][axis] > plane]
+
+                return Box(self.lo, tuple(hi), below), Box(tuple(lo), self.hi, above)
+
+        raise ValueError("Median cut found no plane to split the box at.")
 
-def gen_colors(img):
-    """Loop until 16 colors are generated."""
-    color_cmd = ColorThief(img).get_palette
 
-    for i in range(0, 10, 1):
-        raw_colors = color_cmd(color_count=8 + i)
+def split(boxes, key, target):
+    """Cut the box with the highest key until target boxes were added.
 
-        if len(raw_colors) >= 8:
-            break
+    Boxes are kept sorted by key with the highest last, ties in the order
+    they were pushed, so the cuts match ColorThief's queue exactly.
+    """
+    added = 1
 
-        if i == 10:
-            logging.error("ColorThief couldn't generate a suitable palette.")
-            sys.exit(1)
+    for _ in range(MAX_ITERATION):
+        boxes.sort(key=key)
+        box = boxes.pop()
+
+        if not box.count:
+            boxes.append(box)
+            continue
+
+        first, second = box.cut()
+        boxes.append(first)
+
+        if second:
+            boxes.append(second)
+            added += 1
+
+        if added >= target:
+            return
+
+    raise ValueError("MMCQ got stuck at %d boxes, none can be cut." % len(boxes))
+
+
+def histogram(pixels):
+    """Count pixels per cell of the quantized cube, and the bounding box."""
+    cells = {}
+
+    for r, g, b in pixels:
+        rgb = (r >> RSHIFT, g >> RSHIFT, b >> RSHIFT)
+        cells[rgb] = cells.get(rgb, 0) + 1
+
+    if not cells:
+        raise ValueError("No opaque, non white pixels to quantize.")
+
+    lo = tuple(min(rgb[i] for rgb in cells) for i in range(3))
+    hi = tuple(max(rgb[i] for rgb in cells) for i in range(3))
+
+    return Box(lo, hi, list(cells.items()))
+
+
+def quantize(pixels, size=8):
+    """Yield palettes of size, size + 1, ... colors from one histogram.
+
+    The first palette is the one ColorThief's get_palette returns when
+    asked for size + 1 colors. The cuts up to it are split between
+    population and population times volume the same way; every later
+    palette is one more population times volume cut of the last.
+    """
+    boxes = [histogram(pixels)]
+
+    def population(box):
+        return box.count
+
+    def occupancy(box):
+        return box.count * box.volume
+
+    split(boxes, population, FRACT_BY_POPULATIONS * (size + 1))
+
+    # Hand the boxes over in the order ColorThief pops them.
+    boxes.sort(key=population)
+    boxes.reverse()
+
+    while True:
+        if len(boxes) >= size:
+            boxes.sort(key=occupancy)
+            yield [box.avg() for box in reversed(boxes)]
+
+        split(boxes, occupancy, 2)
+
+
+def sample(img, quality=QUALITY):
+    """Every quality'th pixel that is mostly opaque and not white."""
+    with Image.open(img) as image:
+        data = image.convert("RGBA").tobytes()
+
+    # Stride over the raw bytes, only sampled pixels become tuples.
+    step = 4 * quality
+    pixels = zip(data[0::step], data[1::step], data[2::step], data[3::step])
+
+    return [
+        (r, g, b)
+        for r, g, b, a in pixels
+        if a >= 125 and not (r > 250 and g > 250 and b > 250)
+    ]
+
+
+def gen_colors(img):
+    """Quantize the image into 8 colors."""
+    with trace.span("decode"):
+        pixels = sample(img)
+
+    try:
+        with trace.span("quantize"):
+            raw_colors = next(quantize(pixels, 8))
+
+    except ValueError as err:
+        logging.error("ColorThief couldn't generate a suitable palette: %s", err)
+        logging.error("Try another backend or another image. (wal --backend)")
+        sys.exit(1)
 
     return [util.rgb_to_hex(color) for color in raw_colors]
 
@@ -54,26 +277,31 @@ def gen_colors(img):
 def adjust(cols, light):
     """Create palette."""
     cols.sort(key=util.rgb_to_yiq)
-    raw_colors = [*cols, *cols]
 
+    # Everything derives from the original first color, so it goes last.
     if light:
-        raw_colors[0] = util.lighten_color(cols[0], 0.90)
-        raw_colors[7] = util.darken_color(cols[0], 0.75)
+        steps = [
+            (7, 0, util.darken_colors, 0.75),
+            (8, 0, util.lighten_colors, 0.20),
+            (0, 0, util.lighten_colors, 0.90),
+        ]
 
     else:
-        for color in raw_colors:
-            color = util.lighten_color(color, 0.40)
+        steps = [
+            (7, 0, util.lighten_colors, 0.60),
+            (8, 0, util.lighten_colors, 0.20),
+            (0, 0, util.darken_colors, 0.80),
+        ]
 
-        raw_colors[0] = util.darken_color(cols[0], 0.80)
-        raw_colors[7] = util.lighten_color(cols[0], 0.60)
-
-    raw_colors[8] = util.lighten_color(cols[0], 0.20)
-    raw_colors[15] = raw_colors[7]
-
-    return raw_colors
+    return util.adjust_palette([*cols, *cols], [*steps, (15, 7, None, None)])
 
 
 def get(img, light=False):
     """Get colorscheme."""
     cols = gen_colors(img)
     return adjust(cols, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    return await colors.in_executor(get, img, light)
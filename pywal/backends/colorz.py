@@ -24,6 +24,7 @@ import sys
 
 try:
     import colorz
+    import numpy as np
 
 except ImportError:
     logging.error("colorz wasn't found on your system.")
@@ -36,8 +37,25 @@ from .. import util
 
 def gen_colors(img):
     """Generate a colorscheme using Colorz."""
-    # pylint: disable=not-callable
-    raw_colors = colorz.colorz(img, n=6, bold_add=0)
+    # Colorz's k-means starts from NumPy's global random state, seed it
+    # for this call only and hand it back as it was.
+    state = np.random.get_state()
+
+    if util.seed_int() is not None:
+        np.random.seed(util.seed_int())
+
+    try:
+        # pylint: disable=not-callable
+        raw_colors = colorz.colorz(img, n=6, bold_add=0)
+
+    finally:
+        np.random.set_state(state)
+
+    if len(raw_colors) < 6:
+        logging.error("colorz failed to generate enough colors.")
+        logging.error("Try another backend or another image. (wal --backend)")
+        sys.exit(1)
+
     return [util.rgb_to_hex([*color[0]]) for color in raw_colors]
 
 
@@ -51,10 +69,9 @@ def adjust(cols, light):
 def get(img, light=False):
     """Get colorscheme."""
     cols = gen_colors(img)
+    return adjust(cols, light)
 
-    if len(cols) < 6:
-        logging.error("colorz failed to generate enough colors.")
-        logging.error("Try another backend or another image. (wal --backend)")
-        sys.exit(1)
 
-    return adjust(cols, light)
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    return await colors.in_executor(get, img, light)
@@ -31,6 +31,7 @@ except ImportError:
     logging.error("Try another backend. (wal --backend)")
     sys.exit(1)
 
+from .. import colors
 from .. import util
 
 
@@ -44,26 +45,31 @@ def gen_colors(img):
 def adjust(cols, light):
     """Create palette."""
     cols.sort(key=util.rgb_to_yiq)
-    raw_colors = [*cols, *cols]
 
+    # Everything derives from the original first color, so it goes last.
     if light:
-        raw_colors[0] = util.lighten_color(cols[0], 0.90)
-        raw_colors[7] = util.darken_color(cols[0], 0.75)
+        steps = [
+            (7, 0, util.darken_colors, 0.75),
+            (8, 0, util.lighten_colors, 0.20),
+            (0, 0, util.lighten_colors, 0.90),
+        ]
 
     else:
-        for color in raw_colors:
-            color = util.lighten_color(color, 0.40)
+        steps = [
+            (7, 0, util.lighten_colors, 0.60),
+            (8, 0, util.lighten_colors, 0.20),
+            (0, 0, util.darken_colors, 0.80),
+        ]
 
-        raw_colors[0] = util.darken_color(cols[0], 0.80)
-        raw_colors[7] = util.lighten_color(cols[0], 0.60)
-
-    raw_colors[8] = util.lighten_color(cols[0], 0.20)
-    raw_colors[15] = raw_colors[7]
-
-    return raw_colors
+    return util.adjust_palette([*cols, *cols], [*steps, (15, 7, None, None)])
 
 
 def get(img, light=False):
     """Get colorscheme."""
     cols = gen_colors(img)
     return adjust(cols, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    return await colors.in_executor(get, img, light)
@@ -44,13 +44,17 @@ def gen_colors(img):
 def adjust(cols, light):
     """Create palette."""
     cols.sort(key=util.rgb_to_yiq)
-    raw_colors = [*cols, *cols]
-    raw_colors[0] = util.lighten_color(cols[0], 0.40)
+    steps = [(0, 0, util.lighten_colors, 0.40), *colors.generic_steps(light)]
 
-    return colors.generic_adjust(raw_colors, light)
+    return util.adjust_palette([*cols, *cols], steps)
 
 
 def get(img, light=False):
     """Get colorscheme."""
     cols = gen_colors(img)
     return adjust(cols, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    return await colors.in_executor(get, img, light)
@@ -0,0 +1,136 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Generate a colorscheme using NumPy median cut quantization.
+"""
+
+import logging
+import sys
+
+try:
+    import numpy as np
+
+    # Needed by thumbnail.decode.
+    import PIL  # pylint: disable=unused-import
+
+except ImportError:
+    logging.error("NumPy or Pillow wasn't found on your system.")
+    logging.error("Try another backend. (wal --backend)")
+    sys.exit(1)
+
+from .. import colors
+from .. import thumbnail
+from .. import trace
+from .. import util
+from . import wal
+
+
+def decode(img):
+    """Decode the first frame, scaled down to the pixel budget."""
+    return np.asarray(thumbnail.decode(img), dtype=np.uint8).reshape(-1, 3)
+
+
+class Histogram:
+    """A fixed size, 5 bit per channel color histogram fed incrementally."""
+
+    def __init__(self):
+        self.counts = np.zeros(32768)
+        self.sums = np.zeros((32768, 3))
+
+    def add(self, pixels):
+        """Add an (N, 3) array of pixels to the histogram."""
+        red, green, blue = (pixels >> 3).astype(np.uint16).T
+        index = red << 10 | green << 5 | blue
+
+        self.counts += np.bincount(index, minlength=32768)
+
+        for i in range(3):
+            self.sums[:, i] += np.bincount(index, pixels[:, i], 32768)
+
+    def colors(self):
+        """The used bins' mean colors and pixel counts."""
+        used = self.counts.nonzero()[0]
+        return self.sums[used] / self.counts[used, None], self.counts[used]
+
+
+def histogram(pixels):
+    """Bin the pixels at 5 bits per channel, keeping each bin's mean."""
+    hist = Histogram()
+    hist.add(pixels)
+
+    return hist.colors()
+
+
+def median_cut(colors, counts, color_count):
+    """Split the histogram into boxes along their widest channel."""
+    boxes = [np.arange(len(colors))]
+
+    while len(boxes) < color_count:
+        ranges = [np.ptp(colors[box], axis=0) for box in boxes]
+        widest = max(range(len(boxes)), key=lambda i: ranges[i].max())
+
+        if len(boxes[widest]) < 2:
+            break
+
+        box = boxes.pop(widest)
+        box = box[np.argsort(colors[box, ranges[widest].argmax()], kind="stable")]
+
+        # Split at the population median, leaving neither half empty.
+        total = np.cumsum(counts[box])
+        half = np.searchsorted(total, total[-1] / 2)
+        half = min(max(half, 1), len(box) - 1)
+
+        boxes += [box[:half], box[half:]]
+
+    return [
+        np.average(colors[box], axis=0, weights=counts[box]).round().astype(int)
+        for box in boxes
+    ]
+
+
+def gen_colors(img):
+    """Quantize the image down to 16 colors."""
+    with trace.span("decode"):
+        pixels = decode(img)
+
+    with trace.span("quantize"):
+        raw_colors = median_cut(*histogram(pixels), 16)
+
+    if len(raw_colors) < 16:
+        logging.error("Median cut couldn't generate a suitable palette.")
+        logging.error("Try another backend or another image. (wal --backend)")
+        sys.exit(1)
+
+    return sorted((util.rgb_to_hex(color) for color in raw_colors), key=util.rgb_to_yiq)
+
+
+def adjust(colors, light):
+    """Adjust the colors the same way the 'wal' backend does."""
+    return wal.adjust(colors, light)
+
+
+def get(img, light=False):
+    """Get colorscheme."""
+    cols = gen_colors(img)
+    return adjust(cols, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    return await colors.in_executor(get, img, light)
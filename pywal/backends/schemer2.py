@@ -21,18 +21,40 @@ Generate a colorscheme using Schemer2.
 """
 
 import logging
+import os
 import shutil
 import subprocess
 import sys
 
 from .. import colors
 from .. import util
+from ..settings import SEED
+
+
+CMD = ["schemer2", "-format", "img::colors", "-minBright", "75", "-in"]
+
+# Go seeds math/rand randomly since 1.20, ask for the old fixed seed.
+ENV = {**os.environ, "GODEBUG": "randautoseed=0"} if SEED else None
 
 
 def gen_colors(img):
-    """Generate a colorscheme using Colorz."""
-    cmd = ["schemer2", "-format", "img::colors", "-minBright", "75", "-in"]
-    return subprocess.check_output([*cmd, img]).splitlines()
+    """Generate a colorscheme using Schemer2."""
+    has_schemer2()
+
+    cols = subprocess.check_output([*CMD, img], env=ENV).splitlines()
+    return [col.decode("UTF-8") for col in cols]
+
+
+async def gen_colors_async(img):
+    """Generate a colorscheme using Schemer2 without blocking.
+
+    Failures raise RuntimeError, sys.exit would end the caller's loop.
+    """
+    if not shutil.which("schemer2"):
+        raise RuntimeError("Schemer2 wasn't found on your system.")
+
+    cols = (await util.check_output_async([*CMD, img], ENV)).splitlines()
+    return [col.decode("UTF-8") for col in cols]
 
 
 def adjust(cols, light):
@@ -43,12 +65,21 @@ def adjust(cols, light):
     return colors.generic_adjust(raw_colors, light)
 
 
-def get(img, light=False):
-    """Get colorscheme."""
+def has_schemer2():
+    """Check to see if the user has schemer2 installed."""
     if not shutil.which("schemer2"):
         logging.error("Schemer2 wasn't found on your system.")
         logging.error("Try another backend. (wal --backend)")
         sys.exit(1)
 
-    cols = [col.decode("UTF-8") for col in gen_colors(img)]
+
+def get(img, light=False):
+    """Get colorscheme."""
+    cols = gen_colors(img)
+    return adjust(cols, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    cols = await gen_colors_async(img)
     return adjust(cols, light)
@@ -0,0 +1,156 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Generate a colorscheme by streaming the image through a fixed size
+histogram. With Imagemagick's stream tool memory doesn't grow with
+resolution; without it only JPEGs stay small.
+"""
+
+import logging
+import shutil
+import subprocess
+import sys
+
+try:
+    import numpy as np
+    from PIL import Image
+
+except ImportError:
+    logging.error("NumPy or Pillow wasn't found on your system.")
+    logging.error("Try another backend. (wal --backend)")
+    sys.exit(1)
+
+from .. import colors
+from .. import thumbnail
+from .. import trace
+from .. import util
+from .mediancut import Histogram, median_cut
+
+# Bytes of raw pixels held at once.
+STRIP_SIZE = 1 << 20
+
+
+def has_stream():
+    """Find Imagemagick's stream tool, which decodes in constant memory."""
+    if shutil.which("magick"):
+        return ["magick", "stream"]
+
+    if shutil.which("stream"):
+        return ["stream"]
+
+    return None
+
+
+def width_im(img, stream_command):
+    """Read the image width from its header, or ask Imagemagick."""
+    size = thumbnail.dimensions(img)
+
+    if size is not None:
+        return size[0]
+
+    # "magick stream" -> "magick identify", "stream" -> "identify".
+    cmd = [*stream_command[:-1], "identify", "-format", "%w", img + "[0]"]
+    return int(subprocess.check_output(cmd))
+
+
+def strips_im(img, width, stream_command):
+    """Read the first frame as rows of raw RGB piped out of Imagemagick."""
+    cmd = [*stream_command, "-map", "rgb", "-storage-type", "char", img + "[0]", "-"]
+    size = max(1, STRIP_SIZE // (width * 3)) * width * 3
+
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+        while data := proc.stdout.read(size):
+            yield np.frombuffer(data, dtype=np.uint8)[: len(data) // 3 * 3]
+
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def strips_pil(image):
+    """Read a Pillow image as rows of raw RGB.
+
+    Pillow has to decode the whole frame first, though JPEGs are decoded
+    at a reduced scale that keeps them near the strip budget.
+    """
+    if image.format != "JPEG":
+        logging.warning("Imagemagick's stream wasn't found on your system.")
+        logging.warning(
+            "Decoding all %sx%s pixels of this %s at once, memory grows with size.",
+            image.width,
+            image.height,
+            image.format,
+        )
+
+    scale = max(1, (image.width * image.height * 3 // STRIP_SIZE) ** 0.5)
+    image.draft("RGB", (int(image.width // scale), int(image.height // scale)))
+    image = image.convert("RGB")
+    rows = max(1, STRIP_SIZE // (image.width * 3))
+
+    for top in range(0, image.height, rows):
+        strip = image.crop((0, top, image.width, min(top + rows, image.height)))
+        yield np.asarray(strip, dtype=np.uint8)
+
+
+def gen_colors(img):
+    """Feed the image strip by strip into a histogram and quantize it."""
+    hist = Histogram()
+    stream_command = has_stream()
+
+    with trace.span("stream"):
+        if stream_command:
+            for strip in strips_im(img, width_im(img, stream_command), stream_command):
+                hist.add(strip.reshape(-1, 3))
+
+        else:
+            try:
+                with Image.open(img) as image:
+                    for strip in strips_pil(image):
+                        hist.add(strip.reshape(-1, 3))
+
+            except Image.DecompressionBombError as err:
+                logging.error("%s", err)
+                logging.error("Install Imagemagick to stream images this large.")
+                sys.exit(1)
+
+    with trace.span("quantize"):
+        raw_colors = median_cut(*hist.colors(), 8)
+
+    if len(raw_colors) < 8:
+        logging.error("Streaming couldn't generate a suitable palette.")
+        logging.error("Try another backend or another image. (wal --backend)")
+        sys.exit(1)
+
+    return [util.rgb_to_hex(color) for color in raw_colors]
+
+
+def adjust(cols, light):
+    """Create palette."""
+    cols.sort(key=util.rgb_to_yiq)
+    return colors.generic_adjust([*cols, *cols], light)
+
+
+def get(img, light=False):
+    """Get colorscheme."""
+    cols = gen_colors(img)
+    return adjust(cols, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    return await colors.in_executor(get, img, light)
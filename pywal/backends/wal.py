@@ -21,33 +21,156 @@ Generate a colorscheme using imagemagick.
 """
 
 import logging
+import os
 import re
 import shutil
 import subprocess
 import sys
+import tempfile
 
+from .. import thumbnail
+from .. import trace
 from .. import util
+from ..settings import PIXEL_BUDGET
 
+COLORS = 16
+RETRIES = 20
 
-def imagemagick(color_count, img, magick_command):
-    """Call Imagemagick to generate a scheme."""
-    flags = ["-resize", "25%", "-colors", str(color_count), "-unique-colors", "txt:-"]
+# Palette sizes tried per retry run. Every size costs a quantization,
+# so batches keep retries from computing sizes they won't need.
+RETRY_BATCH = 4
+
+# Every -colors result comes back as an Nx1 binary PPM.
+PPM_HEADER = re.compile(rb"P6\s+(\d+)\s+(\d+)\s+255\s")
+
+
+def sample_flags(img):
+    """Imagemagick flags to sample the image down to the pixel budget."""
+    # A budget of 0 keeps the full resolution.
+    if PIXEL_BUDGET <= 0:
+        return [], []
+
+    size = thumbnail.dimensions(img)
+
+    # Imagemagick can scale by area itself, only shrinking.
+    if size is None:
+        return [], ["-resize", "%s@>" % PIXEL_BUDGET]
+
+    width, height = thumbnail.sample_size(size)
+
+    if (width, height) == tuple(size):
+        return [], []
+
+    # jpeg:size lets libjpeg decode at a reduced scale to begin with.
+    geometry = "%sx%s" % (width, height)
+    return ["-define", "jpeg:size=" + geometry], ["-resize", geometry + "!"]
+
+
+def quantize_flags(counts):
+    """Flags writing each -colors result as a PPM to stdout."""
+    flags = []
+
+    for count in counts:
+        flags += ["(", "+clone", "-colors", str(count), "-unique-colors"]
+        flags += ["-depth", "8", "+set", "comment", "-write", "ppm:-", "+delete", ")"]
+
+    return flags
+
+
+def sample_cmd(img, sample, magick_command):
+    """Decode and resize once, keeping the sample, and quantize it."""
+    read_flags, resize_flags = sample_flags(img)
     img += "[0]"
 
-    return subprocess.check_output([*magick_command, img, *flags]).splitlines()
+    return [
+        *magick_command,
+        *read_flags,
+        img,
+        *resize_flags,
+        "-write",
+        sample,
+        *quantize_flags([COLORS]),
+        "null:",
+    ]
 
 
-def has_im():
-    """Check to see if the user has im installed."""
+def retry_cmd(sample, counts, magick_command):
+    """Quantize the kept sample to several palette sizes in one run."""
+    return [*magick_command, sample, *quantize_flags(counts), "null:"]
+
+
+def read_ppms(data):
+    """Split concatenated binary PPMs into lists of hex colors."""
+    palettes = []
+    match = PPM_HEADER.match(data)
+
+    while match:
+        start = match.end()
+        end = start + int(match[1]) * int(match[2]) * 3
+        pixels = data[start:end]
+
+        # Upper case hex, as the txt: format printed it.
+        palettes.append(
+            ["#%02X%02X%02X" % (*pixels[i : i + 3],) for i in range(0, len(pixels), 3)]
+        )
+        match = PPM_HEADER.match(data, end)
+
+    return palettes
+
+
+def pick(palettes):
+    """The first palette with enough colors, or None."""
+    return next((p for p in palettes if len(p) >= COLORS), None)
+
+
+def find_im():
+    """Find Imagemagick's command, None if it isn't installed."""
     if shutil.which("magick"):
         return ["magick"]
 
     if shutil.which("convert"):
         return ["convert"]
 
-    logging.error("Imagemagick wasn't found on your system.")
-    logging.error("Try another backend. (wal --backend)")
-    sys.exit(1)
+    return None
+
+
+def has_im():
+    """Check to see if the user has im installed."""
+    magick_command = find_im()
+
+    if magick_command is None:
+        logging.error("Imagemagick wasn't found on your system.")
+        logging.error("Try another backend. (wal --backend)")
+        sys.exit(1)
+
+    return magick_command
+
+
+def imagemagick_runs(img, sample, magick_command):
+    """Yield the Imagemagick commands for a palette, sent their output.
+
+    Returns the palette, or None when no palette size had enough colors.
+    Retries only quantize the sample, the image is decoded once.
+    """
+    with trace.span("imagemagick", color_count=COLORS):
+        output = yield sample_cmd(img, sample, magick_command)
+        colors = pick(read_ppms(output))
+
+    if colors is None:
+        logging.warning("Imagemagick couldn't generate a palette.")
+        logging.warning("Trying palette sizes up to %s.", COLORS + RETRIES - 1)
+
+    for first in range(COLORS + 1, COLORS + RETRIES, RETRY_BATCH):
+        if colors is not None:
+            break
+
+        counts = range(first, min(first + RETRY_BATCH, COLORS + RETRIES))
+
+        with trace.span("imagemagick", color_count=first, retries=len(counts)):
+            output = yield retry_cmd(sample, counts, magick_command)
+            colors = pick(read_ppms(output))
+
+    return colors
 
 
 def gen_colors(img):
@@ -55,21 +178,51 @@ def gen_colors(img):
     of hex colors."""
     magick_command = has_im()
 
-    for i in range(0, 20, 1):
-        raw_colors = imagemagick(16 + i, img, magick_command)
+    with tempfile.TemporaryDirectory(prefix="wal-") as tmp:
+        runs = imagemagick_runs(img, os.path.join(tmp, "sample.mpc"), magick_command)
 
-        if len(raw_colors) > 16:
-            break
+        try:
+            cmd = next(runs)
+
+            while True:
+                cmd = runs.send(subprocess.check_output(cmd))
+
+        except StopIteration as done:
+            colors = done.value
 
-        if i == 19:
-            logging.error("Imagemagick couldn't generate a suitable palette.")
-            sys.exit(1)
+    if colors is None:
+        logging.error("Imagemagick couldn't generate a suitable palette.")
+        sys.exit(1)
 
-        else:
-            logging.warning("Imagemagick couldn't generate a palette.")
-            logging.warning("Trying a larger palette size %s", 16 + i)
+    return colors
 
-    return [re.search("#.{6}", str(col)).group(0) for col in raw_colors[1:]]
+
+async def gen_colors_async(img):
+    """Like gen_colors, running Imagemagick as an asyncio subprocess.
+
+    Failures raise RuntimeError, sys.exit would end the caller's loop.
+    """
+    magick_command = find_im()
+
+    if magick_command is None:
+        raise RuntimeError("Imagemagick wasn't found on your system.")
+
+    with tempfile.TemporaryDirectory(prefix="wal-") as tmp:
+        runs = imagemagick_runs(img, os.path.join(tmp, "sample.mpc"), magick_command)
+
+        try:
+            cmd = next(runs)
+
+            while True:
+                cmd = runs.send(await util.check_output_async(cmd))
+
+        except StopIteration as done:
+            colors = done.value
+
+    if colors is None:
+        raise RuntimeError("Imagemagick couldn't generate a suitable palette.")
+
+    return colors
 
 
 def adjust(colors, light):
@@ -79,27 +232,36 @@ def adjust(colors, light):
 
     # Manually adjust colors.
     if light:
-        for color in raw_colors:
-            color = util.saturate_color(color, 0.5)
+        raw_colors[0] = raw_colors[8] = colors[-1]
+        raw_colors[7] = raw_colors[15] = colors[0]
 
-        raw_colors[0] = util.lighten_color(colors[-1], 0.85)
-        raw_colors[7] = colors[0]
-        raw_colors[8] = util.darken_color(colors[-1], 0.4)
-        raw_colors[15] = colors[0]
+        steps = [
+            (0, 0, util.lighten_colors, 0.85),
+            (8, 8, util.darken_colors, 0.4),
+        ]
 
     else:
+        eeeeee = util.hex_to_rgb_array(["#EEEEEE"])
+        steps = [
+            (7, 7, util.blend_colors, eeeeee),
+            (8, 7, util.darken_colors, 0.30),
+            (15, 15, util.blend_colors, eeeeee),
+        ]
+
         # Darken the background color slightly.
         if raw_colors[0][1] != "0":
-            raw_colors[0] = util.darken_color(raw_colors[0], 0.40)
-
-        raw_colors[7] = util.blend_color(raw_colors[7], "#EEEEEE")
-        raw_colors[8] = util.darken_color(raw_colors[7], 0.30)
-        raw_colors[15] = util.blend_color(raw_colors[15], "#EEEEEE")
+            steps.insert(0, (0, 0, util.darken_colors, 0.40))
 
-    return raw_colors
+    return util.adjust_palette(raw_colors, steps)
 
 
 def get(img, light=False):
     """Get colorscheme."""
     colors = gen_colors(img)
     return adjust(colors, light)
+
+
+async def get_async(img, light=False):
+    """Get colorscheme without blocking the event loop."""
+    colors = await gen_colors_async(img)
+    return adjust(colors, light)
@@ -0,0 +1,145 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Scheme cache handling.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from .settings import CACHE_DIR, CACHE_SIZE, THUMBNAIL_CACHE_BYTES
+
+
+DIGESTS = {}
+
+
+def file_digest(img, cache_dir=CACHE_DIR):
+    """Hash the contents of a file, memoized by inode, mtime and size.
+
+    The memo is kept on disk too, so a one-shot run only has to stat a
+    wallpaper it has seen before.
+    """
+    stat = os.stat(img)
+    key = "%s_%s_%s_%s" % (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    if key in DIGESTS:
+        return DIGESTS[key]
+
+    digest_dir = os.path.join(cache_dir, "digests")
+    digest_file = os.path.join(digest_dir, key)
+
+    try:
+        with open(digest_file, "r") as file:
+            DIGESTS[key] = file.read().strip()
+
+        touch(digest_file)
+        return DIGESTS[key]
+
+    except OSError:
+        pass
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(img, "rb") as img_file:
+        for chunk in iter(lambda: img_file.read(1 << 20), b""):
+            digest.update(chunk)
+
+    DIGESTS[key] = digest.hexdigest()
+
+    # Write atomically, other processes may be hashing the same file.
+    try:
+        os.makedirs(digest_dir, exist_ok=True)
+        tmp_file = "%s.%s.%s" % (digest_file, os.getpid(), threading.get_ident())
+
+        with open(tmp_file, "w") as file:
+            file.write(DIGESTS[key])
+
+        os.replace(tmp_file, digest_file)
+        prune(digest_dir)
+
+    except OSError:
+        logging.warning("Couldn't save the digest of %s.", img)
+
+    return DIGESTS[key]
+
+
+def touch(cache_file):
+    """Mark a cache entry as recently used."""
+    try:
+        os.utime(cache_file)
+    except OSError:
+        pass
+
+
+def entries_by_age(cache_dir):
+    """List the files in a cache directory with their stats, newest first.
+
+    Other processes prune the same directories, so files that vanish
+    while we look at them are skipped.
+    """
+    entries = []
+
+    try:
+        for entry in os.scandir(cache_dir):
+            try:
+                if entry.is_file():
+                    entries.append((entry.stat(), entry.path))
+            except FileNotFoundError:
+                continue
+
+    except FileNotFoundError:
+        pass
+
+    entries.sort(key=lambda e: e[0].st_mtime_ns, reverse=True)
+    return entries
+
+
+def prune(cache_dir, size=CACHE_SIZE):
+    """Evict the least recently used entries beyond the size cap."""
+    if size <= 0:
+        return
+
+    for _, path in entries_by_age(cache_dir)[size:]:
+        remove(path)
+
+
+def prune_bytes(cache_dir, size=THUMBNAIL_CACHE_BYTES):
+    """Evict the least recently used entries beyond the size cap in bytes."""
+    if size <= 0:
+        return
+
+    total = 0
+
+    for stat, path in entries_by_age(cache_dir):
+        total += stat.st_size
+
+        if total > size:
+            remove(path)
+
+
+def remove(cache_file):
+    """Evict a cache entry, another process may have beaten us to it."""
+    try:
+        os.remove(cache_file)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logging.warning("Couldn't evict %s.", cache_file)
@@ -22,22 +22,20 @@ Generate a palette using various backends.
 
 import logging
 import os
-import random
-import re
-import sys
 
+from . import backends
+from . import cache
+from . import store
 from . import theme
+from . import thumbnail
+from . import trace
 from . import util
-from .settings import CACHE_DIR, MODULE_DIR, __cache_version__
+from .settings import CACHE_DIR, PIXEL_BUDGET, SCHEME_STORE, SEED, __cache_version__
 
 
 def list_backends():
     """List color backends."""
-    return [
-        b.name.replace(".py", "")
-        for b in os.scandir(os.path.join(MODULE_DIR, "backends"))
-        if "__" not in b.name
-    ]
+    return list(backends.BACKENDS)
 
 
 def normalize_img_path(img: str):
@@ -51,7 +49,7 @@ def normalize_img_path(img: str):
 
 
 def colors_to_dict(colors, img):
-    """Convert list of colors to pywal format."""
+    """Convert list of colors or a palette to pywal format."""
     return {
         "wallpaper": normalize_img_path(img),
         "alpha": util.Color.alpha_num,
@@ -81,87 +79,299 @@ def colors_to_dict(colors, img):
     }
 
 
-def generic_adjust(colors, light):
-    """Generic color adjustment for themers."""
+def generic_steps(light):
+    """Adjustment steps shared by the themers."""
     if light:
-        for color in colors:
-            color = util.saturate_color(color, 0.60)
-            color = util.darken_color(color, 0.5)
+        return [
+            (0, 0, util.lighten_colors, 0.95),
+            (7, 0, util.darken_colors, 0.75),
+            (8, 0, util.darken_colors, 0.25),
+            (15, 7, None, None),
+        ]
 
-        colors[0] = util.lighten_color(colors[0], 0.95)
-        colors[7] = util.darken_color(colors[0], 0.75)
-        colors[8] = util.darken_color(colors[0], 0.25)
-        colors[15] = colors[7]
+    return [
+        (0, 0, util.darken_colors, 0.80),
+        (7, 0, util.lighten_colors, 0.75),
+        (8, 0, util.lighten_colors, 0.25),
+        (15, 7, None, None),
+    ]
 
-    else:
-        colors[0] = util.darken_color(colors[0], 0.80)
-        colors[7] = util.lighten_color(colors[0], 0.75)
-        colors[8] = util.lighten_color(colors[0], 0.25)
-        colors[15] = colors[7]
 
-    return colors
+def generic_adjust(colors, light):
+    """Generic color adjustment for themers."""
+    return util.adjust_palette(colors, generic_steps(light))
 
 
 def saturate_colors(colors, amount):
-    """Saturate all colors."""
+    """Saturate all colors of a list of hex colors or a palette."""
     if amount and float(amount) <= 1.0:
-        for i, _ in enumerate(colors):
-            if i not in [0, 7, 8, 15]:
-                colors[i] = util.saturate_color(colors[i], float(amount))
+        index = [i for i in range(len(colors)) if i not in [0, 7, 8, 15]]
+        step = (index, index, util.saturate_colors, float(amount))
+
+        if isinstance(colors, util.Palette):
+            return colors.adjust([step])
+
+        colors = util.adjust_palette(colors, [step])
 
     return colors
 
 
+def output_key():
+    """The settings besides the image that change what backends output."""
+    seed = "%08x" % util.seed_int() if SEED else ""
+    return "%s_%s" % (PIXEL_BUDGET, seed)
+
+
 def cache_fname(img, backend, light, cache_dir, sat=""):
     """Create the cache file name."""
     color_type = "light" if light else "dark"
-    file_name = re.sub("[/|\\|.]", "_", img)
-    file_size = os.path.getsize(img)
+    file_digest = cache.file_digest(img)
 
-    file_parts = [file_name, color_type, backend, sat, file_size, __cache_version__]
+    file_parts = [file_digest, color_type, backend, sat, output_key()]
+    file_parts.append(__cache_version__)
     return [cache_dir, "schemes", "%s_%s_%s_%s_%s_%s.json" % (*file_parts,)]
 
 
+def raw_cache_fname(img, backend, cache_dir):
+    """Create the cache file name of a backend's raw colors."""
+    file_digest = cache.file_digest(img)
+
+    file_parts = [file_digest, backend, output_key(), __cache_version__]
+    return [cache_dir, "raw", "%s_raw_%s_%s_%s.json" % (*file_parts,)]
+
+
 def get_backend(backend):
     """Figure out which backend to use."""
     if backend == "random":
-        backends = list_backends()
-        random.shuffle(backends)
-        return backends[0]
+        names = [name for name in list_backends() if backends.available(name)]
+
+        if not names:
+            logging.error("No backend has its dependencies installed, using wal.")
+            return "wal"
+
+        return util.rng().choice(names)
 
     return backend
 
 
+def read_cache(img, backend, light, cache_dir, sat):
+    """Find the cache file for a scheme, and the scheme if it's cached."""
+    # 9f86d081884c7d659a2feaa0c55ad015_dark_wal__250000__1.3.0.json
+    with trace.span("cache lookup"):
+        cache_file = os.path.join(*cache_fname(img, backend, light, cache_dir, sat))
+
+        if SCHEME_STORE == "sqlite":
+            colors = store.get(cache_dir, os.path.basename(cache_file))
+
+        elif os.path.isfile(cache_file):
+            with trace.span("cache read"):
+                colors = util.read_file_json(cache_file)
+                cache.touch(cache_file)
+
+        else:
+            colors = None
+
+    if colors is None:
+        return cache_file, None
+
+    colors["wallpaper"] = normalize_img_path(img)
+    colors["alpha"] = util.Color.alpha_num
+    logging.info("Found cached colorscheme.")
+
+    return cache_file, colors
+
+
+def load_backend(backend):
+    """Pick the backend to use and import it."""
+    backend = get_backend(backend)
+
+    # Check dependencies through the registry before importing
+    # anything, which keeps the dependencies "optional".
+    if backend != "wal" and not backends.available(backend):
+        logging.warning(
+            "Backend %s is missing %s, using wal.",
+            backend,
+            ", ".join(backends.missing(backend)),
+        )
+        backend = "wal"
+
+    logging.info("Using %s backend.", backend)
+
+    with trace.span("backend import", backend=backend):
+        return backend, backends.load(backend)
+
+
+def backend_image(img, backend, cache_dir):
+    """The image a backend should read, the shared thumbnail if it can."""
+    if not backends.BACKENDS[backend]["thumbnail"]:
+        return img
+
+    # Decode once and hand every backend the same small thumbnail.
+    with trace.span("thumbnail"):
+        return thumbnail.get(img, cache_dir)
+
+
+def read_raw(img, backend, cache_dir):
+    """Find the cache file for a backend's raw colors, and the colors."""
+    raw_file = os.path.join(*raw_cache_fname(img, backend, cache_dir))
+
+    with trace.span("raw cache lookup"):
+        if SCHEME_STORE == "sqlite":
+            return raw_file, store.get(cache_dir, os.path.basename(raw_file))
+
+        if not os.path.isfile(raw_file):
+            return raw_file, None
+
+        cache.touch(raw_file)
+        return raw_file, util.read_file_json(raw_file)
+
+
+def save_raw(raw_colors, raw_file):
+    """Cache a backend's raw colors."""
+    if SCHEME_STORE == "sqlite":
+        cache_dir = os.path.dirname(os.path.dirname(raw_file))
+        store.put(cache_dir, os.path.basename(raw_file), raw_colors)
+
+    else:
+        util.save_file_json(raw_colors, raw_file)
+        cache.prune(os.path.dirname(raw_file))
+
+
+def get_raw(img, backend, module, cache_dir):
+    """Get a backend's raw colors, extracting them only once per image."""
+    raw_file, raw_colors = read_raw(img, backend, cache_dir)
+
+    if raw_colors is None:
+        img_src = backend_image(img, backend, cache_dir)
+
+        with trace.span("backend", backend=backend):
+            raw_colors = module.gen_colors(img_src)
+
+        save_raw(raw_colors, raw_file)
+
+    return raw_colors
+
+
+def finish_scheme(colors, img, sat):
+    """Saturate a backend's 16 colors and turn them into a scheme."""
+    colors = util.Palette.from_hex(colors)
+
+    with trace.span("saturate_colors"):
+        colors = saturate_colors(colors, sat)
+
+    with trace.span("colors_to_dict"):
+        return colors_to_dict(colors, img)
+
+
+def derive(raw_colors, module, light, img, sat):
+    """Turn a backend's raw colors into a scheme, without any caching."""
+    # Backends sort and edit the list they're given in place.
+    with trace.span("adjust"):
+        colors = module.adjust(list(raw_colors), light)
+
+    return finish_scheme(colors, img, sat)
+
+
+def save_scheme(colors, img, sat, cache_file):
+    """Finish a backend's colors into a scheme and cache it."""
+    return cache_scheme(finish_scheme(colors, img, sat), cache_file)
+
+
+def cache_scheme(colors, cache_file):
+    """Cache a finished scheme."""
+    if SCHEME_STORE == "sqlite":
+        with trace.span("store put"):
+            cache_dir = os.path.dirname(os.path.dirname(cache_file))
+            store.put(cache_dir, os.path.basename(cache_file), colors)
+
+    else:
+        with trace.span("save_file_json"):
+            util.save_file_json(colors, cache_file)
+            cache.prune(os.path.dirname(cache_file))
+
+    logging.info("Generation complete.")
+    return colors
+
+
 def get(img, light=False, backend="wal", cache_dir=CACHE_DIR, sat=""):
     """Generate a palette."""
-    # home_dylan_img_jpg_backend_1.2.2.json
-    cache_name = cache_fname(img, backend, light, cache_dir, sat)
-    cache_file = os.path.join(*cache_name)
+    with trace.span("get", img=img, backend=backend, light=light, sat=sat):
+        cache_file, colors = read_cache(img, backend, light, cache_dir, sat)
 
-    if os.path.isfile(cache_file):
-        colors = theme.file(cache_file)
-        colors["alpha"] = util.Color.alpha_num
-        logging.info("Found cached colorscheme.")
+        if colors is None:
+            logging.info("Generating a colorscheme.")
+            backend, module = load_backend(backend)
+            raw_colors = get_raw(img, backend, module, cache_dir)
+            colors = derive(raw_colors, module, light, img, sat)
+            colors = cache_scheme(colors, cache_file)
 
-    else:
-        logging.info("Generating a colorscheme.")
-        backend = get_backend(backend)
-
-        # Dynamically import the backend we want to use.
-        # This keeps the dependencies "optional".
-        try:
-            __import__("pywal.backends.%s" % backend)
-        except ImportError:
-            __import__("pywal.backends.wal")
-            backend = "wal"
-
-        logging.info("Using %s backend.", backend)
-        backend = sys.modules["pywal.backends.%s" % backend]
-        colors = getattr(backend, "get")(img, light)
-        colors = colors_to_dict(saturate_colors(colors, sat), img)
-
-        util.save_file_json(colors, cache_file)
-        logging.info("Generation complete.")
+    return colors
+
+
+def get_variants(img, backend="wal", cache_dir=CACHE_DIR, sat=""):
+    """Generate the dark and light schemes from a single extraction."""
+    with trace.span("get_variants", img=img, backend=backend, sat=sat):
+        backend, module = load_backend(backend)
+        raw_colors = get_raw(img, backend, module, cache_dir)
+
+        return {
+            "dark": derive(raw_colors, module, False, img, sat),
+            "light": derive(raw_colors, module, True, img, sat),
+        }
+
+
+async def in_executor(func, *args, executor=None):
+    """Run a blocking call in an executor, the loop's default if None.
+
+    Backends give up through sys.exit, which would end the caller's
+    event loop, so that comes back as a RuntimeError instead.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+
+    except SystemExit as err:
+        raise RuntimeError("%s couldn't finish." % func.__qualname__) from err
+
+
+async def get_async(
+    img, light=False, backend="wal", cache_dir=CACHE_DIR, sat="", executor=None
+):
+    """Generate a palette without blocking the event loop.
+
+    Subprocess backends run through asyncio subprocesses, the others in
+    the given executor (the loop's default one if None). Failures raise
+    an exception rather than exiting.
+    """
+    with trace.span("get_async", img=img, backend=backend, light=light, sat=sat):
+        # Hashing the wallpaper can take a while.
+        cache_file, colors = await in_executor(
+            read_cache, img, backend, light, cache_dir, sat
+        )
+
+        if colors is None:
+            logging.info("Generating a colorscheme.")
+            backend, module = await in_executor(load_backend, backend)
+            raw_file, raw_colors = await in_executor(read_raw, img, backend, cache_dir)
+
+            if raw_colors is None:
+                img_src = await in_executor(backend_image, img, backend, cache_dir)
+
+                with trace.span("backend", backend=backend):
+                    if backends.BACKENDS[backend]["subprocess"]:
+                        raw_colors = await module.gen_colors_async(img_src)
+                    else:
+                        raw_colors = await in_executor(
+                            module.gen_colors, img_src, executor=executor
+                        )
+
+                await in_executor(save_raw, raw_colors, raw_file)
+
+            colors = derive(raw_colors, module, light, img, sat)
+            colors = await in_executor(cache_scheme, colors, cache_file)
 
     return colors
 
@@ -0,0 +1,176 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Long-lived palette daemon.
+
+Keeps backends imported and recent schemes in memory in front of the
+CACHE_DIR/schemes files, answering colors.get requests sent as JSON
+lines over a Unix socket. Start it with 'python3 -m pywal.daemon'.
+"""
+
+import collections
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+
+from . import backends
+from . import colors
+from . import util
+from .settings import DAEMON_SOCKET
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Answer one JSON request per line until the client hangs up."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {"colors": self.server.get(**json.loads(line))}
+
+            # Backends and theme.file give up through sys.exit, which must
+            # not take the daemon down with it.
+            except (Exception, SystemExit) as err:  # pylint: disable=broad-except
+                response = {"error": "%s: %s" % (type(err).__name__, err)}
+
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server with an in-memory LRU of palettes."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path=DAEMON_SOCKET, size=256):
+        super().__init__(socket_path, Handler)
+        self.schemes = collections.OrderedDict()
+        self.size = size
+        self.lock = threading.Lock()
+
+    def get(self, img, light=False, backend="wal", sat="", direct=False):
+        """colors.get, answered from memory when the scheme is recent.
+
+        Direct requests run the backend's own get on the original image,
+        like wrap.py does without a daemon, skipping the thumbnail and
+        the scheme cache.
+        """
+        key = (direct, colors.cache_fname(img, backend, light, "", sat)[-1])
+
+        with self.lock:
+            palette = self.schemes.get(key)
+
+            if palette is not None:
+                self.schemes.move_to_end(key)
+
+        if palette is None:
+            # Kept as the backend's hex strings, case and all.
+            if direct:
+                palette = backends.load(backend).get(img, light)[:16]
+
+            else:
+                scheme = colors.get(img, light, backend, sat=sat)
+                palette = util.Palette.from_hex(
+                    [scheme["colors"]["color%s" % i] for i in range(16)]
+                )
+
+            with self.lock:
+                self.schemes[key] = palette
+
+                while len(self.schemes) > self.size:
+                    self.schemes.popitem(last=False)
+
+        return colors.colors_to_dict(palette, img)
+
+
+def listening(socket_path):
+    """Check whether something answers on the socket."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+
+    except OSError:
+        return False
+
+    return True
+
+
+def serve(socket_path=DAEMON_SOCKET, size=256):
+    """Run the daemon until interrupted."""
+    if os.path.exists(socket_path):
+        if listening(socket_path):
+            logging.error("A daemon is already listening on %s.", socket_path)
+            sys.exit(1)
+
+        # Left behind by a daemon that didn't shut down cleanly.
+        os.remove(socket_path)
+
+    util.create_dir(os.path.dirname(socket_path))
+
+    # Treat SIGTERM like Ctrl+C so the socket gets cleaned up either way.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with Server(socket_path, size) as server:
+        os.chmod(socket_path, 0o600)
+        logging.info("Listening on %s.", socket_path)
+
+        try:
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            os.remove(socket_path)
+
+
+def request(
+    img, light=False, backend="wal", sat="", socket_path=DAEMON_SOCKET, direct=False
+):
+    """Ask a running daemon for a palette, None when there isn't one."""
+    query = {
+        "img": os.path.abspath(img),
+        "light": light,
+        "backend": backend,
+        "sat": sat,
+        "direct": direct,
+    }
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(query).encode() + b"\n")
+            response = json.loads(sock.makefile("rb").readline())
+
+    except (OSError, ValueError):
+        return None
+
+    if "error" in response:
+        logging.error("Daemon failed: %s", response["error"])
+        return None
+
+    return response["colors"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve(*sys.argv[1:2])
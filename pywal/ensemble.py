@@ -0,0 +1,201 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Run several backends on one image at once and hedge between them.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+
+from . import backends
+from . import colors
+from . import trace
+from . import util
+from .settings import CACHE_DIR
+
+
+def run_backend(backend, img, light, cache_dir):
+    """Decode for, run and time one backend in a worker process."""
+    start = time.perf_counter()
+
+    try:
+        img_src = colors.backend_image(img, backend, cache_dir)
+        raw_colors = backends.load(backend).get(img_src, light)
+
+    # A worker that exits is replaced, but its result never arrives.
+    except SystemExit:
+        raise RuntimeError("%s couldn't generate a palette" % backend) from None
+
+    return raw_colors, time.perf_counter() - start
+
+
+def run_subprocess(backend, img, light, cache_dir, tasks, stop):
+    """Decode for, run and time a subprocess backend in this thread.
+
+    The loop and task go into tasks, so cancel() can stop the backend
+    and kill its subprocess from another thread.
+    """
+    import asyncio
+
+    async def main():
+        tasks[backend] = (asyncio.get_running_loop(), asyncio.current_task())
+
+        # Stopped before the task was there to cancel.
+        if stop.is_set():
+            raise asyncio.CancelledError
+
+        return await backends.load(backend).get_async(img_src, light)
+
+    start = time.perf_counter()
+    img_src = colors.backend_image(img, backend, cache_dir)
+    raw_colors = asyncio.run(main())
+
+    return raw_colors, time.perf_counter() - start
+
+
+def submit(pool, func, *args):
+    """Run func in a multiprocessing pool, with a future for its result."""
+    future = concurrent.futures.Future()
+    pool.apply_async(
+        func, args, callback=future.set_result, error_callback=future.set_exception
+    )
+
+    return future
+
+
+def cancel(tasks, stop):
+    """Cancel the subprocess backends still running in threads."""
+    stop.set()
+
+    for loop, task in list(tasks.values()):
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+
+        # The loop already finished and closed.
+        except RuntimeError:
+            pass
+
+
+def merge(candidates):
+    """Merge candidate palettes slot by slot into a consensus palette.
+
+    Each slot takes the medoid, the candidate color closest to all the
+    others in that slot, so the result only holds extracted colors.
+    """
+    import numpy as np
+
+    rgb = np.stack([util.hex_to_rgb_array(c[:16]) for c in candidates])
+    dist = np.linalg.norm(rgb[:, None] - rgb[None, :], axis=-1).sum(axis=1)
+
+    return [candidates[b][i] for i, b in enumerate(dist.argmin(axis=0))]
+
+
+def get(
+    img,
+    light=False,
+    names=None,
+    budget=None,
+    consensus=False,
+    cache_dir=CACHE_DIR,
+    sat="",
+):
+    """Run several backends on an image in parallel.
+
+    Subprocess backends run in threads, the others in processes. The
+    first result wins, or with consensus every result that arrives
+    within the budget (in seconds) is merged. Backends still running
+    then are stopped: worker processes are terminated and subprocesses
+    killed. Returns the scheme and a report of each backend's status and
+    timing.
+    """
+    start = time.perf_counter()
+    names = [n for n in names or backends.BACKENDS if backends.available(n)]
+    subprocs = [n for n in names if backends.BACKENDS[n]["subprocess"]]
+
+    # Spawn rather than fork, the thread pool may hold the import lock.
+    threads = concurrent.futures.ThreadPoolExecutor(max(len(subprocs), 1))
+    procs = multiprocessing.get_context("spawn").Pool(len(names) - len(subprocs) or 1)
+    tasks = {}
+    stop = threading.Event()
+
+    report = {name: {"status": "cancelled", "time": None} for name in names}
+    results = {}
+    futures = {}
+
+    with trace.span("ensemble", backends=names, consensus=consensus):
+        # Decoding happens in the workers, where the budget covers it.
+        for name in names:
+            if name in subprocs:
+                future = threads.submit(
+                    run_subprocess, name, img, light, cache_dir, tasks, stop
+                )
+            else:
+                future = submit(procs, run_backend, name, img, light, cache_dir)
+
+            futures[future] = name
+
+        # Starting the pools counts against the budget too.
+        if budget is not None:
+            timeout = max(budget - (time.perf_counter() - start), 0)
+        else:
+            timeout = None
+
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=timeout):
+                name = futures[future]
+
+                try:
+                    results[name], elapsed = future.result()
+                    report[name] = {"status": "ok", "time": elapsed}
+
+                # Backends give up through sys.exit, even in a worker.
+                except (Exception, SystemExit) as err:  # pylint: disable=broad-except
+                    elapsed = time.perf_counter() - start
+                    report[name] = {"status": "error: %s" % err, "time": elapsed}
+                    continue
+
+                if not consensus:
+                    break
+
+        except concurrent.futures.TimeoutError:
+            for future, name in futures.items():
+                if not future.done():
+                    report[name] = {"status": "timeout", "time": budget}
+
+        # Stop the stragglers, the budget covers them too.
+        finally:
+            procs.terminate()
+            cancel(tasks, stop)
+            threads.shutdown(wait=False, cancel_futures=True)
+
+    for name, info in report.items():
+        logging.info("Backend %s: %s (%s s).", name, info["status"], info["time"])
+
+    if not results:
+        logging.error("No backend generated a palette in time.")
+        sys.exit(1)
+
+    raw_colors = merge(list(results.values())) if consensus else [*results.values()][0]
+    palette = colors.saturate_colors(util.Palette.from_hex(raw_colors), sat)
+
+    return colors.colors_to_dict(palette, img), report
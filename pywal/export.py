@@ -0,0 +1,143 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Render a colorscheme into the formats its consumers read, in one pass.
+"""
+
+import hashlib
+import json
+import os
+import shlex
+import threading
+
+from . import util
+
+
+COLORS = ["color%s" % i for i in range(16)]
+
+# Format strings built once, filled in per scheme with format_map.
+TEMPLATES = {
+    "kitty.conf": "".join(
+        [
+            "foreground {foreground}\n",
+            "background {background}\n",
+            "cursor {cursor}\n",
+            *("%s {%s}\n" % (name, name) for name in COLORS),
+        ]
+    ),
+    "colors.Xresources": "".join(
+        [
+            "*foreground: {foreground}\n",
+            "*background: {background}\n",
+            "*cursorColor: {cursor}\n",
+            *("*.%s: {%s}\n" % (name, name) for name in COLORS),
+        ]
+    ),
+    "colors.sh": "".join(
+        [
+            "wallpaper={wallpaper_sh}\n",
+            "foreground='{foreground}'\n",
+            "background='{background}'\n",
+            "cursor='{cursor}'\n",
+            *("%s='{%s}'\n" % (name, name) for name in COLORS),
+        ]
+    ),
+    "colours.nix": "".join(
+        [
+            "{{\n",
+            "  special = {{\n",
+            '    foreground = "{foreground}";\n',
+            '    background = "{background}";\n',
+            '    cursor = "{cursor}";\n',
+            "  }};\n",
+            "  colours = {{\n",
+            *('    colour%s = "{%s}";\n' % (name[5:], name) for name in COLORS),
+            "  }};\n",
+            "  colors = {{\n",
+            *('    %s = "{%s}";\n' % (name, name) for name in COLORS),
+            "  }};\n",
+            "}}\n",
+        ]
+    ),
+}
+
+TARGETS = ["colours.json", *TEMPLATES]
+
+
+def aliases(scheme):
+    """The colors under both their colourN and colorN names."""
+    colors = {}
+
+    for name in COLORS:
+        colors["colour" + name[5:]] = colors[name] = scheme["colors"][name]
+
+    return colors
+
+
+def render(scheme, targets=None):
+    """Render a scheme from colors_to_dict into each target's text."""
+    variables = {
+        **scheme["special"],
+        **scheme["colors"],
+        "wallpaper_sh": shlex.quote(str(scheme.get("wallpaper", ""))),
+    }
+    rendered = {}
+
+    for target in targets or TARGETS:
+        if target == "colours.json":
+            rendered[target] = json.dumps(aliases(scheme), indent=2) + "\n"
+        else:
+            rendered[target] = TEMPLATES[target].format_map(variables)
+
+    return rendered
+
+
+def content_hash(out_file):
+    """Hash of a file's contents, None if it can't be read."""
+    try:
+        with open(out_file, "rb") as file:
+            return hashlib.blake2b(file.read(), digest_size=16).digest()
+    except OSError:
+        return None
+
+
+def write(scheme, out_dir, targets=None):
+    """Write every target to out_dir, skipping unchanged ones.
+
+    Returns the files that were actually written.
+    """
+    util.create_dir(out_dir)
+    written = []
+
+    for target, text in render(scheme, targets).items():
+        out_file = os.path.join(out_dir, target)
+        data = text.encode()
+
+        if content_hash(out_file) == hashlib.blake2b(data, digest_size=16).digest():
+            continue
+
+        tmp_file = "%s.%s.%s" % (out_file, os.getpid(), threading.get_ident())
+
+        with open(tmp_file, "wb") as file:
+            file.write(data)
+
+        os.replace(tmp_file, out_file)
+        written.append(out_file)
+
+    return written
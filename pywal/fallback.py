@@ -0,0 +1,163 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Try backends in turn within a time budget, until one gives a palette.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import sys
+import time
+
+from . import backends
+from . import colors
+from . import trace
+from .settings import CACHE_DIR, FALLBACK_BUDGET, FALLBACK_CHAIN
+
+POOL = {}
+
+
+def run_backend(backend, img, light, cache_dir):
+    """Decode for and run a backend in the worker process."""
+    try:
+        img_src = colors.backend_image(img, backend, cache_dir)
+        return backends.load(backend).get(img_src, light)
+
+    # A worker that exits is replaced, but its result never arrives.
+    except SystemExit:
+        raise RuntimeError("%s couldn't generate a palette" % backend) from None
+
+
+def run_python(backend, img, light, timeout, cache_dir):
+    """Run a Python backend in a worker, killing it at the deadline."""
+    if "pool" not in POOL:
+        POOL["pool"] = multiprocessing.get_context("spawn").Pool(1)
+
+    result = POOL["pool"].apply_async(run_backend, (backend, img, light, cache_dir))
+
+    try:
+        return result.get(timeout)
+
+    except multiprocessing.TimeoutError:
+        POOL.pop("pool").terminate()
+        raise TimeoutError from None
+
+
+def run_subprocess(backend, img, light, timeout, cache_dir):
+    """Run a subprocess backend, killing its subprocess at the deadline."""
+    import asyncio
+
+    async def run():
+        img_src = await colors.in_executor(
+            colors.backend_image, img, backend, cache_dir
+        )
+        return await backends.load(backend).get_async(img_src, light)
+
+    async def bounded():
+        # Before 3.11 this isn't the builtin TimeoutError.
+        try:
+            return await asyncio.wait_for(run(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError from None
+
+    try:
+        asyncio.get_running_loop()
+
+    except RuntimeError:
+        return asyncio.run(bounded())
+
+    # Called from a coroutine, asyncio.run needs a thread of its own.
+    with concurrent.futures.ThreadPoolExecutor(1) as pool:
+        return pool.submit(asyncio.run, bounded()).result()
+
+
+def get(
+    img,
+    light=False,
+    chain=None,
+    budget=FALLBACK_BUDGET,
+    cache_dir=CACHE_DIR,
+    sat="",
+):
+    """Generate a palette with the first backend of the chain that can.
+
+    A cached scheme from any backend in the chain is returned straight
+    away. Otherwise each available backend in turn gets an even share of
+    what is left of the budget (in seconds, None for no limit), and is
+    killed when its share runs out. Returns the scheme and the backend
+    that produced it.
+    """
+    chain = chain or FALLBACK_CHAIN
+    deadline = None if budget is None else time.monotonic() + budget
+    cache_files = {}
+
+    for backend in chain:
+        cache_files[backend], scheme = colors.read_cache(
+            img, backend, light, cache_dir, sat
+        )
+
+        if scheme is not None:
+            return scheme, backend
+
+    for backend in chain:
+        if not backends.available(backend):
+            logging.warning(
+                "Backend %s is missing %s, skipping it.",
+                backend,
+                ", ".join(backends.missing(backend)),
+            )
+
+    chain = [backend for backend in chain if backends.available(backend)]
+
+    # The thumbnail decode happens in the worker, under the deadline too.
+    for i, backend in enumerate(chain):
+        timeout = None
+
+        # Split what's left of the budget evenly over the rest of the
+        # chain, so one slow backend can't use up every fallback's time.
+        if deadline is not None:
+            timeout = (deadline - time.monotonic()) / (len(chain) - i)
+
+            if timeout <= 0:
+                break
+
+        if backends.BACKENDS[backend]["subprocess"]:
+            run = run_subprocess
+        else:
+            run = run_python
+
+        try:
+            with trace.span("backend", backend=backend):
+                raw_colors = run(backend, img, light, timeout, cache_dir)
+
+        except TimeoutError:
+            logging.warning("Backend %s ran out of time.", backend)
+            continue
+
+        # Backends give up through sys.exit, which only ends this attempt.
+        except (Exception, SystemExit) as err:  # pylint: disable=broad-except
+            logging.warning("Backend %s failed: %s", backend, err)
+            continue
+
+        logging.info("Using %s backend.", backend)
+        return colors.save_scheme(raw_colors, img, sat, cache_files[backend]), backend
+
+    logging.error("No backend generated a palette in time.")
+    sys.exit(1)
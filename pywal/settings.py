@@ -31,7 +31,7 @@ import os
 
 
 __version__ = "3.3.1"
-__cache_version__ = "1.1.0"
+__cache_version__ = "1.3.0"
 
 
 HOME = os.getenv("HOME", os.getenv("USERPROFILE"))
@@ -41,3 +41,16 @@ XDG_CONF_DIR = os.getenv("XDG_CONFIG_HOME", os.path.join(HOME, ".config"))
 CACHE_DIR = os.getenv("PYWAL_CACHE_DIR", os.path.join(XDG_CACHE_DIR, "wal"))
 CONF_DIR = os.path.join(XDG_CONF_DIR, "wal")
 MODULE_DIR = os.path.dirname(__file__)
+
+CACHE_SIZE = int(os.getenv("PYWAL_CACHE_SIZE", "1024"))
+THUMBNAIL_CACHE_BYTES = int(os.getenv("PYWAL_THUMBNAIL_CACHE", str(128 << 20)))
+PIXEL_BUDGET = int(os.getenv("PYWAL_PIXEL_BUDGET", "250000"))
+TRACE_FILE = os.getenv("PYWAL_TRACE", "")
+SCHEME_STORE = os.getenv("PYWAL_SCHEME_STORE", "files")
+SEED = os.getenv("PYWAL_SEED", "")
+
+FALLBACK_CHAIN = os.getenv("PYWAL_FALLBACK", "wal,mediancut,colorthief").split(",")
+FALLBACK_BUDGET = float(os.getenv("PYWAL_BUDGET", "0")) or None
+
+RUNTIME_DIR = os.getenv("XDG_RUNTIME_DIR", CACHE_DIR)
+DAEMON_SOCKET = os.getenv("PYWAL_SOCKET", os.path.join(RUNTIME_DIR, "pywal.sock"))
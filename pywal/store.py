@@ -0,0 +1,181 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Single file scheme store, an alternative to one JSON file per scheme.
+
+Schemes live in CACHE_DIR/schemes.db, a SQLite database in WAL mode,
+under the same names as the files in CACHE_DIR/schemes, so either
+layout can be migrated to or exported from the other.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from .settings import CACHE_SIZE
+from . import util
+
+
+LOCAL = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schemes (
+    name TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    data TEXT NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schemes_digest ON schemes (digest);
+CREATE INDEX IF NOT EXISTS schemes_used ON schemes (used);
+"""
+
+
+def connect(cache_dir):
+    """Open, once per thread, the store for a cache directory."""
+    import sqlite3
+
+    db_file = os.path.join(cache_dir, "schemes.db")
+    connections = LOCAL.__dict__.setdefault("connections", {})
+
+    if db_file not in connections:
+        util.create_dir(cache_dir)
+
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+
+        connections[db_file] = conn
+
+    return connections[db_file]
+
+
+def get(cache_dir, name):
+    """Read a scheme by cache file name, None if it isn't stored."""
+    return get_many(cache_dir, [name]).get(name)
+
+
+def get_many(cache_dir, names):
+    """Read many schemes at once, as a dict of the ones found."""
+    conn = connect(cache_dir)
+    found = {}
+
+    # SQLite limits the number of bound parameters per statement.
+    for i in range(0, len(names), 500):
+        chunk = list(names[i : i + 500])
+        marks = ",".join("?" * len(chunk))
+
+        for name, data in conn.execute(
+            "SELECT name, data FROM schemes WHERE name IN (%s)" % marks, chunk
+        ):
+            found[name] = json.loads(data)
+
+        if found:
+            conn.execute(
+                "UPDATE schemes SET used = ? WHERE name IN (%s)" % marks,
+                [time.time(), *chunk],
+            )
+
+    return found
+
+
+def get_digest(cache_dir, digest):
+    """Every stored scheme of an image, keyed by cache file name."""
+    rows = connect(cache_dir).execute(
+        "SELECT name, data FROM schemes WHERE digest = ?", (digest,)
+    )
+    return {name: json.loads(data) for name, data in rows}
+
+
+def put(cache_dir, name, scheme):
+    """Store a scheme under a cache file name."""
+    put_many(cache_dir, {name: scheme})
+
+
+def put_many(cache_dir, schemes, size=CACHE_SIZE):
+    """Store many schemes in one transaction, then prune."""
+    conn = connect(cache_dir)
+    now = time.time()
+
+    with conn:
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR REPLACE INTO schemes VALUES (?, ?, ?, ?)",
+            [
+                (name, name.split("_", 1)[0], json.dumps(scheme), now)
+                for name, scheme in schemes.items()
+            ],
+        )
+
+    prune(cache_dir, size)
+
+
+def prune(cache_dir, size=CACHE_SIZE):
+    """Evict the least recently used schemes beyond the size cap."""
+    if size <= 0:
+        return
+
+    with connect(cache_dir) as conn:
+        conn.execute("BEGIN")
+        conn.execute(
+            "DELETE FROM schemes WHERE name NOT IN "
+            "(SELECT name FROM schemes ORDER BY used DESC LIMIT ?)",
+            (size,),
+        )
+
+
+def migrate(cache_dir, remove=False):
+    """Import every JSON scheme file into the store."""
+    scheme_dir = os.path.join(cache_dir, "schemes")
+    schemes = {}
+
+    try:
+        entries = [e for e in os.scandir(scheme_dir) if e.name.endswith(".json")]
+    except FileNotFoundError:
+        entries = []
+
+    for entry in entries:
+        try:
+            schemes[entry.name] = util.read_file_json(entry.path)
+        except (OSError, ValueError):
+            logging.warning("Skipping unreadable scheme %s.", entry.path)
+
+    put_many(cache_dir, schemes, size=0)
+
+    if remove:
+        for name in schemes:
+            os.remove(os.path.join(scheme_dir, name))
+
+    logging.info("Migrated %s schemes.", len(schemes))
+    return len(schemes)
+
+
+def export(cache_dir, name):
+    """Write a stored scheme back out as JSON for theme.file."""
+    scheme = get(cache_dir, name)
+
+    if scheme is None:
+        return None
+
+    export_file = os.path.join(cache_dir, "schemes", name)
+    util.save_file_json(scheme, export_file)
+
+    return export_file
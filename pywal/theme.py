@@ -20,29 +20,219 @@
 Theme file handling.
 """
 
+import collections
+import copy
+import json
 import logging
 import os
-import random
 import sys
+import threading
 
-from .settings import CACHE_DIR, CONF_DIR, MODULE_DIR
+from .settings import CACHE_DIR, CONF_DIR, MODULE_DIR, __cache_version__
 from . import util
 
 
+Theme = collections.namedtuple("Theme", ("name", "path"))
+
+INDEX_FILE = os.path.join(CACHE_DIR, "themes.json")
+INDEX = {}
+TREES = {}
+
+
+def theme_dirs():
+    """Built-in and user theme directories, keyed by (source, variant)."""
+    return {
+        ("module", "dark"): os.path.join(MODULE_DIR, "colorschemes", "dark"),
+        ("module", "light"): os.path.join(MODULE_DIR, "colorschemes", "light"),
+        ("user", "dark"): os.path.join(CONF_DIR, "colorschemes", "dark"),
+        ("user", "light"): os.path.join(CONF_DIR, "colorschemes", "light"),
+    }
+
+
+def mtime(path):
+    """Modification time of a path in ns, None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_dir(theme_dir, old):
+    """Index a theme directory, reusing entries whose file is unchanged."""
+    themes = {}
+
+    try:
+        entries = [e for e in os.scandir(theme_dir) if e.is_file()]
+    except OSError:
+        entries = []
+
+    for entry in sorted(entries, key=lambda e: e.name):
+        file_mtime = entry.stat().st_mtime_ns
+
+        if entry.name in old and old[entry.name]["mtime"] == file_mtime:
+            themes[entry.name] = old[entry.name]
+            continue
+
+        try:
+            data = parse(entry.path)
+        except (OSError, ValueError, KeyError, IndexError, TypeError):
+            logging.warning("Skipping invalid theme %s.", entry.path)
+            continue
+
+        themes[entry.name] = {"path": entry.path, "mtime": file_mtime, "data": data}
+
+    return themes
+
+
+def load_index(index_file=INDEX_FILE):
+    """Read the theme index, updating only directories that changed."""
+    dirs = theme_dirs()
+    index = INDEX.get(index_file)
+
+    if index is None:
+        try:
+            index = util.read_file_json(index_file)
+        except (OSError, ValueError):
+            index = {}
+
+        if index.get("version") != __cache_version__:
+            index = {"version": __cache_version__, "dirs": {}}
+
+    stale = {
+        theme_dir: dir_mtime
+        for theme_dir, dir_mtime in ((d, mtime(d)) for d in dirs.values())
+        if index["dirs"].get(theme_dir, {}).get("mtime", -1) != dir_mtime
+    }
+
+    if stale:
+        index = {"version": __cache_version__, "dirs": dict(index["dirs"])}
+
+        for theme_dir, dir_mtime in stale.items():
+            old = index["dirs"].get(theme_dir, {}).get("themes", {})
+            index["dirs"][theme_dir] = {
+                "mtime": dir_mtime,
+                "themes": scan_dir(theme_dir, old),
+            }
+
+        save_index(index, index_file)
+
+    if stale or "lists" not in index:
+        index["lists"] = {
+            key: list(index["dirs"].get(theme_dir, {}).get("themes", {}).values())
+            for key, theme_dir in dirs.items()
+        }
+
+    INDEX[index_file] = index
+    return index
+
+
+def save_index(index, index_file=INDEX_FILE):
+    """Atomically write the theme index as compact JSON."""
+    data = {"version": index["version"], "dirs": index["dirs"]}
+    tmp_file = "%s.%s.%s" % (index_file, os.getpid(), threading.get_ident())
+
+    try:
+        util.create_dir(os.path.dirname(index_file))
+
+        with open(tmp_file, "w") as file:
+            json.dump(data, file, separators=(",", ":"))
+
+        os.replace(tmp_file, index_file)
+
+    except OSError:
+        logging.warning("Couldn't write to %s.", index_file)
+
+
+def indexed(source, variant):
+    """Indexed theme entries for one (source, variant) directory."""
+    return load_index()["lists"][(source, variant)]
+
+
 def list_themes(dark=True):
     """List all installed theme files."""
     dark = "dark" if dark else "light"
-    themes = os.scandir(os.path.join(MODULE_DIR, "colorschemes", dark))
-    return [t for t in themes if os.path.isfile(t.path)]
+    themes = indexed("module", dark)
+    return [Theme(os.path.basename(t["path"]), t["path"]) for t in themes]
 
 
 def list_themes_user():
     """List user theme files."""
-    themes = [
-        *os.scandir(os.path.join(CONF_DIR, "colorschemes/dark/")),
-        *os.scandir(os.path.join(CONF_DIR, "colorschemes/light/")),
-    ]
-    return [t for t in themes if os.path.isfile(t.path)]
+    themes = [*indexed("user", "dark"), *indexed("user", "light")]
+    return [Theme(os.path.basename(t["path"]), t["path"]) for t in themes]
+
+
+def palette_features(colors):
+    """Flatten color0-color7 of a palette into one CIELAB vector."""
+    # color8-color15 are mostly derived from the first eight, and every
+    # extra dimension costs the KD-tree pruning.
+    if isinstance(colors, dict):
+        colors = [colors["colors"]["color%s" % i] for i in range(8)]
+
+    return util.rgb_array_to_lab(util.hex_to_rgb_array(colors[:8])).ravel()
+
+
+def theme_tree(light=False):
+    """Spatial index over the palettes of every theme of one variant."""
+    import numpy as np
+
+    bri = "light" if light else "dark"
+    lists = (indexed("module", bri), indexed("user", bri))
+    cached = TREES.get(bri)
+
+    # Rebuilt only when load_index replaced the theme lists.
+    if cached is not None and all(a is b for a, b in zip(cached[0], lists)):
+        return cached[1:]
+
+    themes, vectors = [], []
+
+    for entry in (*lists[0], *lists[1]):
+        try:
+            vectors.append(palette_features(entry["data"]))
+        except (KeyError, ValueError):
+            continue
+
+        themes.append(Theme(os.path.basename(entry["path"]), entry["path"]))
+
+    vectors = np.array(vectors).reshape(-1, 24)
+
+    try:
+        from scipy.spatial import cKDTree
+
+        tree = cKDTree(vectors) if len(vectors) else None
+    except ImportError:
+        tree = None
+
+    TREES[bri] = (lists, themes, tree, vectors)
+    return themes, tree, vectors
+
+
+def nearest(colors, light=False, count=1):
+    """Find the installed themes closest to a palette, nearest first.
+
+    colors is a scheme dict from colors.get or a list of hex colors.
+    Distance is euclidean over color0-color7 in CIELAB. SciPy's KD-tree
+    answers the query when installed, a NumPy scan otherwise.
+    """
+    import numpy as np
+
+    themes, tree, vectors = theme_tree(light)
+    count = min(count, len(themes))
+
+    if not count:
+        return []
+
+    query = palette_features(colors)
+
+    if tree is not None:
+        _, order = tree.query(query, k=count)
+        order = np.atleast_1d(order)
+
+    else:
+        dist = ((vectors - query) ** 2).sum(axis=1)
+        order = np.argpartition(dist, count - 1)[:count]
+        order = order[np.argsort(dist[order], kind="stable")]
+
+    return [themes[i] for i in order]
 
 
 def terminal_sexy_to_wal(data):
@@ -79,51 +269,79 @@ def parse(theme_file):
 
 def get_random_theme(dark=True):
     """Get a random theme file."""
-    themes = [theme.path for theme in list_themes(dark)]
-    random.shuffle(themes)
-    return themes[0]
+    themes = indexed("module", "dark" if dark else "light")
+    return util.rng().choice(themes)["path"] if themes else None
 
 
 def get_random_theme_user():
     """Get a random theme file from user theme directories."""
-    themes = [theme.path for theme in list_themes_user()]
-    random.shuffle(themes)
-    return themes[0]
+    themes = [*indexed("user", "dark"), *indexed("user", "light")]
+    return util.rng().choice(themes)["path"] if themes else None
 
 
-def file(input_file, light=False):
-    """Import colorscheme from json file."""
-    util.create_dir(os.path.join(CONF_DIR, "colorschemes/light/"))
-    util.create_dir(os.path.join(CONF_DIR, "colorschemes/dark/"))
+def lookup(input_file, light=False, sources=("user", "module")):
+    """Find a named or random theme in the index, in order of sources."""
+    if input_file in ("random", "random_dark", "random_light", "random_user"):
+        # Same selection as get_random_theme(light) for random_light.
+        dark = light if input_file == "random_light" else True
+
+        if input_file == "random_user":
+            themes = [*indexed("user", "dark"), *indexed("user", "light")]
+        else:
+            themes = indexed("module", "dark" if dark else "light")
+
+        return util.rng().choice(themes) if themes else None
 
     theme_name = ".".join((input_file, "json"))
     bri = "light" if light else "dark"
+    dirs = load_index()["dirs"]
+
+    for source in sources:
+        theme_dir = theme_dirs()[(source, bri)]
+        entry = dirs.get(theme_dir, {}).get("themes", {}).get(theme_name)
 
-    user_theme_file = os.path.join(CONF_DIR, "colorschemes", bri, theme_name)
-    theme_file = os.path.join(MODULE_DIR, "colorschemes", bri, theme_name)
+        if entry is not None:
+            return entry
 
-    # Find the theme file.
-    if input_file in ("random", "random_dark"):
-        theme_file = get_random_theme()
+    return None
 
-    elif input_file == "random_light":
-        theme_file = get_random_theme(light)
 
-    elif input_file == "random_user":
-        theme_file = get_random_theme_user()
+def remember(theme_file):
+    """Record the last used theme, writing only when it changes."""
+    last_used = os.path.join(CACHE_DIR, "last_used_theme")
+    name = os.path.basename(theme_file)
 
-    elif os.path.isfile(user_theme_file):
-        theme_file = user_theme_file
+    try:
+        with open(last_used) as last_used_file:
+            if last_used_file.read() == name:
+                return
+    except OSError:
+        pass
 
-    elif os.path.isfile(input_file):
-        theme_file = input_file
+    util.save_file(name, last_used)
+
+
+def file(input_file, light=False):
+    """Import colorscheme from json file."""
+    bri = "light" if light else "dark"
+    entry = lookup(input_file, light, ("user",))
+
+    # User themes, then a path to a theme file, then bundled themes.
+    if entry is None and not os.path.isfile(input_file):
+        entry = lookup(input_file, light, ("module",))
+
+    theme_file = input_file if entry is None else entry["path"]
+
+    # Directory mtimes don't change when a theme is edited in place.
+    if entry is not None and mtime(theme_file) == entry["mtime"]:
+        logging.info("Set theme to \033[1;37m%s\033[0m.", os.path.basename(theme_file))
+        remember(theme_file)
+        return copy.deepcopy(entry["data"])
 
     # Parse the theme file.
     if os.path.isfile(theme_file):
         logging.info("Set theme to \033[1;37m%s\033[0m.", os.path.basename(theme_file))
-        util.save_file(
-            os.path.basename(theme_file), os.path.join(CACHE_DIR, "last_used_theme")
-        )
+        remember(theme_file)
         return parse(theme_file)
 
     logging.error("No %s colorscheme file found.", bri)
@@ -0,0 +1,158 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Shared thumbnail stage for backends.
+"""
+
+import logging
+import os
+import re
+import struct
+import threading
+
+from . import cache
+from . import trace
+from . import util
+from .settings import CACHE_DIR, PIXEL_BUDGET
+
+
+def jpeg_dimensions(img_file):
+    """Walk the JPEG markers up to the start of frame."""
+    img_file.seek(2)
+
+    while True:
+        marker, length = struct.unpack(">2sH", img_file.read(4))
+
+        # SOF0-SOF15, without DHT (C4), JPG (C8) and DAC (CC).
+        if marker[0] == 0xFF and 0xC0 <= marker[1] <= 0xCF:
+            if marker[1] not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">xHH", img_file.read(5))
+                return width, height
+
+        img_file.seek(length - 2, os.SEEK_CUR)
+
+
+def dimensions(img):
+    """Read an image's size from its header, None if it isn't known."""
+    try:
+        with open(img, "rb") as img_file:
+            head = img_file.read(30)
+
+            if head.startswith(b"\x89PNG"):
+                return struct.unpack(">II", head[16:24])
+
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+
+            if head.startswith(b"\xff\xd8"):
+                return jpeg_dimensions(img_file)
+
+            if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+                chunk = head[12:16]
+
+                if chunk == b"VP8 ":
+                    width, height = struct.unpack("<HH", head[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+
+                if chunk == b"VP8L":
+                    bits = int.from_bytes(head[21:25], "little")
+                    return (bits & 0x3FFF) + 1, (bits >> 14 & 0x3FFF) + 1
+
+                if chunk == b"VP8X":
+                    return (
+                        int.from_bytes(head[24:27], "little") + 1,
+                        int.from_bytes(head[27:30], "little") + 1,
+                    )
+
+            if head.startswith(b"BM"):
+                width, height = struct.unpack("<ii", head[18:26])
+                return width, abs(height)
+
+            # Thumbnails are PPM, with the size as text after the magic.
+            if head[:2] == b"P6":
+                fields = re.sub(rb"#[^\n]*", b"", head[2:]).split()
+
+                if len(fields) > 2:
+                    return int(fields[0]), int(fields[1])
+
+    except (OSError, ValueError, struct.error):
+        pass
+
+    return None
+
+
+def sample_size(size, budget=PIXEL_BUDGET):
+    """Scale a (width, height) down to at most budget pixels, 0 for all."""
+    width, height = size
+
+    if budget <= 0 or width * height <= budget:
+        return width, height
+
+    scale = (budget / (width * height)) ** 0.5
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def decode(img, budget=PIXEL_BUDGET):
+    """Decode the first frame to RGB, scaled down to the pixel budget."""
+    from PIL import Image
+
+    with Image.open(img) as image:
+        size = sample_size(image.size, budget)
+
+        # Let JPEG decode straight to a reduced scale when it can.
+        image.draft("RGB", size)
+        image = image.convert("RGB")
+
+    image.thumbnail(size, Image.Resampling.BOX)
+    return image
+
+
+def get(img, cache_dir=CACHE_DIR, budget=PIXEL_BUDGET):
+    """Get the path to a cached PPM thumbnail of the image."""
+    thumb_dir = os.path.join(cache_dir, "thumbnails")
+    file_digest = cache.file_digest(img, cache_dir)
+    thumb_file = os.path.join(thumb_dir, "%s_%s.ppm" % (file_digest, budget))
+
+    if os.path.isfile(thumb_file):
+        cache.touch(thumb_file)
+        return thumb_file
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return img
+
+    try:
+        with trace.span("decode", budget=budget):
+            image = decode(img, budget)
+    # DecompressionBombError isn't an OSError.
+    except (OSError, Image.DecompressionBombError):
+        logging.warning("Couldn't decode %s, using it as is.", img)
+        return img
+
+    # Write atomically, other processes and threads may be reading or
+    # writing the same thumbnail.
+    util.create_dir(thumb_dir)
+    tmp_file = "%s.%s.%s" % (thumb_file, os.getpid(), threading.get_ident())
+    image.save(tmp_file, "PPM")
+    os.replace(tmp_file, thumb_file)
+
+    # Thumbnails are far bigger than schemes, so they're capped by bytes.
+    cache.prune_bytes(thumb_dir)
+    return thumb_file
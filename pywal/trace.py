@@ -0,0 +1,92 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Opt-in per stage tracing.
+
+Set PYWAL_TRACE to a file name, or call trace.enable(), and every stage
+of palette generation is recorded as a span. The trace is written in
+Chrome trace format, which chrome://tracing and Perfetto can open.
+
+Only spans recorded in this process are saved. Work handed to worker
+processes (wrap.py --batch, ensemble, fallback and watch) records its
+spans in the workers, and they're lost.
+"""
+
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+from . import util
+from .settings import CACHE_DIR, TRACE_FILE
+
+
+ENABLED = bool(TRACE_FILE)
+EVENTS = []
+
+
+def enable(enabled=True):
+    """Turn span recording on or off."""
+    global ENABLED  # pylint: disable=global-statement
+    ENABLED = enabled
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """Record the enclosed block as a complete event."""
+    if not ENABLED:
+        yield
+        return
+
+    start = time.perf_counter_ns()
+
+    try:
+        yield
+
+    finally:
+        end = time.perf_counter_ns()
+        EVENTS.append(
+            {
+                "name": name,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+
+def save(trace_file=None):
+    """Write the recorded spans as a Chrome trace.
+
+    Defaults to PYWAL_TRACE, or trace.json in the cache directory.
+    """
+    trace_file = trace_file or TRACE_FILE or os.path.join(CACHE_DIR, "trace.json")
+    util.create_dir(os.path.dirname(trace_file) or ".")
+
+    with open(trace_file, "w") as file:
+        json.dump({"traceEvents": EVENTS, "displayTimeUnit": "ms"}, file)
+
+
+if TRACE_FILE:
+    atexit.register(save)
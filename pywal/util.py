@@ -23,11 +23,34 @@ import colorsys
 import json
 import logging
 import os
+import random
+import threading
+
+from .settings import SEED
+
+
+class LazyNumPy:
+    """Stands in for NumPy until first used, then swaps itself out.
+
+    Importing util, and with it every cache hit, doesn't pay for NumPy.
+    """
+
+    def __getattr__(self, name):
+        global np  # pylint: disable=global-statement
+        import numpy  # pylint: disable=import-outside-toplevel
+
+        np = numpy
+        return getattr(numpy, name)
+
+
+np = LazyNumPy()
 
 
 class Color:
     """Color formats."""
 
+    __slots__ = ("hex_color",)
+
     alpha_num = "100"
 
     def __init__(self, hex_color):
@@ -42,6 +65,56 @@ class Color:
         return self.hex_color[1:]
 
 
+class Palette:
+    """A 16 color palette backed by a (16, 3) uint8 array."""
+
+    __slots__ = ("rgb", "hex_cache")
+
+    def __init__(self, rgb):
+        if isinstance(rgb, bytes):
+            rgb = np.frombuffer(rgb, dtype=np.uint8)
+
+        self.rgb = np.asarray(rgb, dtype=np.uint8).reshape(16, 3)
+        self.hex_cache = None
+
+    @classmethod
+    def from_hex(cls, colors):
+        """Create a palette from the first 16 of a list of hex colors."""
+        return cls(hex_to_rgb_array(colors[:16]))
+
+    @property
+    def hex(self):
+        """The colors as hex strings, converted on first use."""
+        if self.hex_cache is None:
+            self.hex_cache = rgb_array_to_hex(self.rgb)
+
+        return self.hex_cache
+
+    def __len__(self):
+        return 16
+
+    def __getitem__(self, index):
+        return self.hex[index]
+
+    def __iter__(self):
+        return iter(self.hex)
+
+    def __eq__(self, other):
+        return isinstance(other, Palette) and self.rgb.tobytes() == other.rgb.tobytes()
+
+    def __reduce__(self):
+        return (self.__class__, (self.rgb.tobytes(),))
+
+    def adjust(self, steps):
+        """Run the palette through adjust_palette style steps."""
+        rgb = self.rgb.astype(float)
+
+        for dest, source, func, arg in steps:
+            rgb[dest] = rgb[source] if func is None else func(rgb[source], arg)
+
+        return Palette(rgb)
+
+
 def read_file_json(input_file):
     """Read data from a json file."""
     with open(input_file, "r") as json_file:
@@ -60,12 +133,46 @@ def save_file(data, export_file):
 
 
 def save_file_json(data, export_file):
-    """Write data to a json file."""
+    """Atomically write data to a json file.
+
+    Cached schemes are written from background processes too, and must
+    never be read half written.
+    """
     create_dir(os.path.dirname(export_file))
+    tmp_file = "%s.%s.%s" % (export_file, os.getpid(), threading.get_ident())
 
-    with open(export_file, "w") as file:
+    with open(tmp_file, "w") as file:
         json.dump(data, file, indent=4)
 
+    os.replace(tmp_file, export_file)
+
+
+async def check_output_async(cmd, env=None):
+    """Run a command as an asyncio subprocess and return its output.
+
+    The process is killed when the awaiting task is cancelled, so a
+    deadline on the caller also bounds the subprocess.
+    """
+    import asyncio
+    import subprocess
+
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, env=env)
+
+    try:
+        stdout, _ = await proc.communicate()
+
+    except asyncio.CancelledError:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+        raise
+
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout)
+
+    return stdout
+
 
 def create_dir(directory):
     """Alias to create the cache dir."""
@@ -118,6 +225,133 @@ def saturate_color(color, amount):
     return rgb_to_hex((int(r), int(g), int(b)))
 
 
+def hex_to_rgb_array(colors):
+    """Convert a list of hex colors to an (N, 3) float array."""
+    data = bytes.fromhex("".join(color.strip("#") for color in colors))
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(float)
+
+
+def rgb_array_to_hex(colors):
+    """Convert an (N, 3) array of colors to a list of hex colors."""
+    data = colors.astype(np.uint8).tobytes().hex()
+    return ["#" + data[i : i + 6] for i in range(0, len(data), 6)]
+
+
+def darken_colors(colors, amount):
+    """Darken an array of colors."""
+    return np.trunc(colors * (1 - amount))
+
+
+def lighten_colors(colors, amount):
+    """Lighten an array of colors."""
+    return np.trunc(colors + (255 - colors) * amount)
+
+
+def blend_colors(colors, colors2):
+    """Blend two arrays of colors together."""
+    return np.trunc(0.5 * colors + 0.5 * colors2)
+
+
+def saturate_colors(colors, amount):
+    """Saturate an array of colors, matching saturate_color exactly."""
+    rgb = colors / 255.0
+    maxc = rgb.max(axis=-1)
+    minc = rgb.min(axis=-1)
+    light = (maxc + minc) / 2.0
+    rangec = maxc - minc
+
+    # Hue as colorsys.rgb_to_hls computes it, 0 for grays.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rc, gc, bc = np.moveaxis((maxc[..., None] - rgb) / rangec[..., None], -1, 0)
+
+    hue = np.where(
+        rgb[..., 0] == maxc,
+        bc - gc,
+        np.where(rgb[..., 1] == maxc, 2.0 + rc - bc, 4.0 + gc - rc),
+    )
+    hue = np.where(rangec == 0, 0.0, (hue / 6.0) % 1.0)
+
+    if amount == 0.0:
+        return np.trunc(np.repeat(light[..., None], 3, axis=-1) * 255.0)
+
+    # Back to rgb as colorsys.hls_to_rgb does with the new saturation.
+    m2 = np.where(light <= 0.5, light * (1.0 + amount), light + amount - light * amount)
+    m1 = 2.0 * light - m2
+
+    channels = []
+    for offset in (1.0 / 3.0, 0.0, -1.0 / 3.0):
+        h = (hue + offset) % 1.0
+        channels.append(
+            np.select(
+                [h < 1.0 / 6.0, h < 0.5, h < 2.0 / 3.0],
+                [m1 + (m2 - m1) * h * 6.0, m2, m1 + (m2 - m1) * (2.0 / 3.0 - h) * 6.0],
+                m1,
+            )
+        )
+
+    return np.trunc(np.stack(channels, axis=-1) * 255.0)
+
+
+def rgb_array_to_lab(colors):
+    """Convert an (N, 3) array of sRGB colors to CIELAB (D65)."""
+    rgb = colors / 255.0
+    rgb = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+
+    xyz = rgb @ np.array(
+        [
+            [0.4124 / 0.95047, 0.2126, 0.0193 / 1.08883],
+            [0.3576 / 0.95047, 0.7152, 0.1192 / 1.08883],
+            [0.1805 / 0.95047, 0.0722, 0.9505 / 1.08883],
+        ]
+    )
+    xyz = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    x, y, z = np.moveaxis(xyz, -1, 0)
+
+    return np.stack((116 * y - 16, 500 * (x - y), 200 * (y - z)), axis=-1)
+
+
+def adjust_palette(colors, steps):
+    """Run a list of hex colors through (dest, source, func, arg) steps.
+
+    Every step writes func(colors[source], arg) to colors[dest], or a
+    plain copy when func is None. Colors only go through hex at the ends.
+    """
+    rgb = hex_to_rgb_array(colors)
+    hex_colors = np.array(colors, dtype=object)
+    touched = np.zeros(len(colors), dtype=bool)
+
+    for dest, source, func, arg in steps:
+        if func is None:
+            rgb[dest] = rgb[source]
+            hex_colors[dest] = hex_colors[source]
+            touched[dest] = touched[source]
+
+        else:
+            rgb[dest] = func(rgb[source], arg)
+            touched[dest] = True
+
+    # Untouched colors keep their original strings, hex case included.
+    return [
+        new_color if is_new else color
+        for color, new_color, is_new in zip(hex_colors, rgb_array_to_hex(rgb), touched)
+    ]
+
+
 def rgb_to_yiq(color):
     """Sort a list of colors."""
     return colorsys.rgb_to_yiq(*hex_to_rgb(color))
+
+
+def rng():
+    """The random generator to use, seeded in deterministic mode.
+
+    With PYWAL_SEED set, every random choice is made from a fresh
+    generator seeded with it, so identical inputs give identical output
+    across runs, processes and machines.
+    """
+    return random.Random(SEED) if SEED else random
+
+
+def seed_int():
+    """A 32 bit seed derived from PYWAL_SEED, None when it isn't set."""
+    return random.Random(SEED).getrandbits(32) if SEED else None
@@ -0,0 +1,241 @@
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+# OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+# FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+"""
+Watch wallpaper directories and pre-generate their schemes.
+"""
+
+import concurrent.futures
+import ctypes
+import ctypes.util
+import logging
+import multiprocessing
+import os
+import select
+import signal
+import struct
+import sys
+import time
+
+from . import colors
+from .settings import CACHE_DIR
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+# inotify(7) event masks and the fixed part of struct inotify_event.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+EVENT = struct.Struct("iIII")
+
+
+def is_image(path):
+    """Whether a path looks like a wallpaper."""
+    return path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path)
+
+
+def scan(dirs):
+    """Every image in the directories, with its mtime and size."""
+    images = {}
+
+    for directory in dirs:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                stat = entry.stat()
+                images[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+    return images
+
+
+def inotify_watch(dirs):
+    """Open an inotify descriptor watching the directories for new files."""
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    watches = {}
+
+    for directory in dirs:
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+
+        if wd < 0:
+            os.close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed", directory)
+
+        watches[wd] = directory
+
+    return fd, watches
+
+
+def inotify_events(fd, watches, timeout):
+    """Yield changed files as inotify reports them, None on timeouts."""
+    try:
+        while True:
+            if not select.select([fd], [], [], timeout)[0]:
+                yield None
+                continue
+
+            data = os.read(fd, 65536)
+
+            for offset in iter_events(data):
+                wd, _, _, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size : offset + EVENT.size + length]
+                name = os.fsdecode(name.rstrip(b"\0"))
+
+                if wd in watches and name:
+                    yield os.path.join(watches[wd], name)
+
+    finally:
+        os.close(fd)
+
+
+def iter_events(data):
+    """Offsets of the inotify events packed into a read buffer."""
+    offset = 0
+
+    while offset < len(data):
+        yield offset
+        offset += EVENT.size + EVENT.unpack_from(data, offset)[3]
+
+
+def poll_events(dirs, interval):
+    """Yield changed files by rescanning the directories, None when idle."""
+    known = scan(dirs)
+
+    while True:
+        time.sleep(interval)
+        images = scan(dirs)
+
+        for path, stat in images.items():
+            if known.get(path) != stat:
+                yield path
+
+        known = images
+        yield None
+
+
+def low_priority():
+    """Lower a worker's CPU priority so generation never competes."""
+    try:
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+
+    except (AttributeError, OSError):
+        os.nice(10)
+
+
+def pregenerate(img, backend, cache_dir, sat):
+    """Generate and cache the dark and light schemes of an image."""
+    for light in (False, True):
+        try:
+            colors.get(img, light, backend, cache_dir, sat)
+
+        # Backends give up through sys.exit, even in a worker.
+        except (Exception, SystemExit) as err:  # pylint: disable=broad-except
+            return "%s: %s" % (type(err).__name__, err)
+
+    return None
+
+
+def watch(
+    dirs,
+    backend="wal",
+    cache_dir=CACHE_DIR,
+    sat="",
+    workers=2,
+    debounce=1.0,
+    poll=False,
+):
+    """Pre-generate schemes for every new or changed image in dirs.
+
+    Events for a file are debounced until it has been quiet for
+    debounce seconds. Generation runs on a pool of at most workers low
+    priority processes, which never gets more than twice that many
+    jobs queued.
+    """
+    dirs = [os.path.abspath(d) for d in dirs]
+
+    if poll:
+        events = poll_events(dirs, debounce / 2)
+
+    else:
+        try:
+            events = inotify_events(*inotify_watch(dirs), debounce / 2)
+
+        except (AttributeError, OSError, TypeError) as err:
+            logging.warning("inotify unavailable (%s), polling instead.", err)
+            events = poll_events(dirs, debounce / 2)
+
+    # Spawn rather than fork, nothing should inherit the watcher's state.
+    pool = concurrent.futures.ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=low_priority,
+    )
+
+    # Images already there get their schemes too, cache hits are cheap.
+    pending = dict.fromkeys(scan(dirs), 0.0)
+    running = {}
+
+    try:
+        for path in events:
+            now = time.monotonic()
+
+            if path is not None and is_image(path):
+                pending[path] = now
+
+            for future in [f for f in running if f.done()]:
+                img = running.pop(future)
+                error = future.result()
+
+                if error:
+                    logging.warning("Couldn't pre-generate %s: %s", img, error)
+                else:
+                    logging.info("Pre-generated %s.", img)
+
+            for img, last_event in list(pending.items()):
+                if len(running) >= workers * 2:
+                    break
+
+                # Wait for writes to settle, and for an earlier run to end.
+                if now - last_event < debounce or img in running.values():
+                    continue
+
+                del pending[img]
+                running[pool.submit(pregenerate, img, backend, cache_dir, sat)] = img
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    # Treat SIGTERM like Ctrl+C so the workers are shut down either way.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    watch(sys.argv[1:] or ["."])
@@ -1,8 +1,107 @@
+import concurrent.futures
 import importlib
+import json
 import sys
+from concurrent.futures.process import BrokenProcessPool
+
+from pywal import colors, daemon, export
+
+
+def parse_job(job):
+    """Normalize a manifest entry into an (image, backend, light) job."""
+    if isinstance(job, str):
+        job = [job]
+
+    if isinstance(job, (list, tuple)):
+        job = dict(zip(("image", "backend", "light"), job))
+
+    light = job.get("light", False)
+
+    return {
+        "image": job["image"],
+        "backend": job.get("backend", "wal"),
+        "light": light in (True, 1, "1", "true"),
+    }
+
+
+def read_jobs(manifest):
+    """Read jobs from a JSON array or NDJSON manifest, '-' for stdin."""
+    if manifest == "-":
+        data = sys.stdin.read()
+    else:
+        with open(manifest, "r") as manifest_file:
+            data = manifest_file.read()
+
+    # An NDJSON line may itself be an array job, so only a manifest that
+    # parses as a whole is a JSON array.
+    try:
+        jobs = json.loads(data)
+    except json.JSONDecodeError:
+        jobs = [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    if not isinstance(jobs, list):
+        jobs = [jobs]
+
+    return [parse_job(job) for job in jobs]
+
+
+def run_job(job):
+    """Generate a palette for a single job, capturing failures."""
+    result = dict(job)
+
+    try:
+        backend = importlib.import_module(f"pywal.backends.{job['backend']}")
+        result["colors"] = backend.get(job["image"], job["light"])
+
+    # Backends report failure through sys.exit, which must not take the
+    # whole batch down with it.
+    except (Exception, SystemExit) as err:
+        result["error"] = f"{type(err).__name__}: {err}"
+
+    return result
+
+
+def batch(jobs, processes=None):
+    """Run jobs over a process pool, yielding results as they finish."""
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = {pool.submit(run_job, job): job for job in jobs}
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield future.result()
+
+            # A worker that dies breaks the pool, and every job left in it.
+            except BrokenProcessPool as err:
+                yield {**futures[future], "error": f"{type(err).__name__}: {err}"}
+
 
 if __name__ == "__main__" and len(sys.argv) > 1:
-    backend = importlib.import_module(f"pywal.backends.{sys.argv[1]}")
-    light = sys.argv[3] == "1" if len(sys.argv) > 3 else False
+    if sys.argv[1] == "--batch":
+        manifest = sys.argv[2] if len(sys.argv) > 2 else "-"
+        processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+        for result in batch(read_jobs(manifest), processes):
+            print(json.dumps(result), flush=True)
+
+    else:
+        light = sys.argv[3] == "1" if len(sys.argv) > 3 else False
+        scheme = daemon.request(sys.argv[2], light, sys.argv[1], direct=True)
+
+        # Answer from a running daemon, or generate the palette ourselves.
+        # Either way it's the backend's own get on the original image.
+        if scheme is None:
+            backend = importlib.import_module(f"pywal.backends.{sys.argv[1]}")
+            palette = backend.get(sys.argv[2], light)
+
+        # The daemon only sees an absolute path, keep the one we were given.
+        else:
+            palette = [scheme["colors"][f"color{i}"] for i in range(16)]
+
+        scheme = colors.colors_to_dict(palette, sys.argv[2])
+
+        # Render every export target into the given directory, or print.
+        if len(sys.argv) > 4:
+            export.write(scheme, sys.argv[4])
 
-    print(backend.get(sys.argv[2], light))
+        else:
+            print([scheme["colors"][f"color{i}"] for i in range(16)])